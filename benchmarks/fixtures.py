@@ -0,0 +1,180 @@
+"""Deterministic synthetic market data for the benchmarks, so that every chapter's hot paths can be timed offline"""
+
+from datetime import date
+import numpy as np
+import pandas as pd
+
+
+SEED = 42
+
+SIZES = ["small", "medium", "large"]
+
+# Number of trading days in a price history
+PRICE_DAYS = {"small": 250, "medium": 2_500, "large": 25_000}
+
+# (spot exposures, futures contracts) of a cross-hedging universe, over PRICE_DAYS["medium"] trading days
+HEDGE_UNIVERSE = {"small": (20, 5), "medium": (200, 30), "large": (1_000, 60)}
+
+# Maturities of the par yield curve: the 11 FRED tenors, then monthly and weekly grids out to 30 years
+CURVE_TENORS = {
+    "small":  np.array([1/12, 3/12, 6/12, 1, 2, 3, 5, 7, 10, 20, 30]),
+    "medium": np.arange(1, 361) / 12,
+    "large":  np.arange(1, 1561) / 52,
+}
+
+# Number of daily curves in a par yield history (FRED has about 15,000 since 1962)
+CURVE_HISTORY_DAYS = {"small": 250, "medium": 2_500, "large": 15_000}
+
+# (daily closes, listed futures contracts) of an implied carry history
+CARRY_PANEL = {"small": (250, 10), "medium": (2_500, 100), "large": (15_000, 400)}
+
+# Number of futures contracts in the arbitrage scanner's universe (8 listed expiries per underlying)
+FUTURES_UNIVERSE = {"small": 40, "medium": 400, "large": 4_000}
+
+# (maturity in years, coupon payments per year) of the bond priced off the curve
+BOND_SHAPES = {"small": (10, 2), "medium": (30, 12), "large": (30, 52)}
+
+# Number of bonds in a Treasury inventory priced off the curve
+BOND_INVENTORY = {"small": 100, "medium": 2_000, "large": 10_000}
+
+# Number of bonds in the deliverable basket (the real ZB basket has 59)
+BASKET_SIZES = {"small": 20, "medium": 60, "large": 500}
+
+# (maturity in years, payments per year) of the swap legs
+SWAP_SHAPES = {"small": (2, 4), "medium": (10, 12), "large": (30, 12)}
+
+# Number of Gaussian copula scenarios
+N_SIMULATIONS = {"small": 5_000, "medium": 50_000, "large": 100_000}
+
+
+def price_series(n_days, start_price=100.0, volatility=0.015, seed=SEED):
+
+    """GBM daily closes on a business day index"""
+
+    rng = np.random.default_rng(seed)
+    closes = start_price * np.exp(np.cumsum(rng.normal(0, volatility, n_days)))
+    return pd.Series(closes, index=pd.bdate_range("1990-01-01", periods=n_days), name="Close")
+
+
+def hedge_pair(n_days, hedge_ratio=0.8, seed=SEED):
+
+    """Spot and futures closes whose daily changes regress on each other with slope close to hedge_ratio"""
+
+    rng = np.random.default_rng(seed)
+    futures = price_series(n_days, seed=seed)
+    spot_changes = hedge_ratio * futures.diff().fillna(0).to_numpy() + rng.normal(0, 0.5, n_days)
+    spot = pd.Series(100 + np.cumsum(spot_changes), index=futures.index, name="Close")
+    return spot, futures
+
+
+def hedge_universe(n_spots, n_futures, n_days=PRICE_DAYS["medium"], seed=SEED):
+
+    """DataFrames of spot and futures closes, each spot loading on a few of the futures plus idiosyncratic noise"""
+
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2000-01-03", periods=n_days)
+    futures_changes = rng.normal(0, 1, (n_days, n_futures))
+    loadings = rng.normal(0, 1, (n_futures, n_spots)) * (rng.random((n_futures, n_spots)) < 3 / n_futures)
+    spot_changes = futures_changes @ loadings + rng.normal(0, 1, (n_days, n_spots))
+    futures = pd.DataFrame(100 + np.cumsum(futures_changes, axis=0), index=dates, columns=[f"FUT{j}" for j in range(n_futures)])
+    spot = pd.DataFrame(100 + np.cumsum(spot_changes, axis=0), index=dates, columns=[f"SPOT{i}" for i in range(n_spots)])
+    return spot, futures
+
+
+def variation_margin(n_days, multiplier=100, seed=SEED):
+
+    """Daily variation margin of one long contract and the calendar days between settlements"""
+
+    prices = price_series(n_days, start_price=2000, seed=seed)
+    pnl = np.concatenate([[0], np.diff(prices.to_numpy()) * multiplier])
+    calendar_days = np.concatenate([[1], np.diff(prices.index.values).astype("timedelta64[D]").astype(int)])
+    return pnl, calendar_days
+
+
+def par_yields(maturities):
+
+    """Nelson-Siegel shaped par yields (BEY, decimals), humped around 2 years like a recent Treasury curve"""
+
+    maturities = np.asarray(maturities, dtype=float)
+    tau = 2.0
+    decay = (1 - np.exp(-maturities / tau)) / (maturities / tau)
+    return 0.045 - 0.008 * decay + 0.012 * (decay - np.exp(-maturities / tau))
+
+
+def par_yield_history(n_dates, missing=0.05, seed=SEED):
+
+    """(dates x FRED tenors) par yields drifting around the par_yields shape, with a share of tenors missing as in the early FRED history"""
+
+    rng = np.random.default_rng(seed)
+    maturities = CURVE_TENORS["small"]
+    shocks = np.cumsum(rng.normal(0, 0.0005, (n_dates, 1)) + rng.normal(0, 0.0002, (n_dates, len(maturities))), axis=0)
+    history = np.clip(par_yields(maturities) + shocks, 0.0005, None)
+    history[rng.random(history.shape) < missing] = np.nan
+    return maturities, history
+
+
+def bond_inventory(n_bonds, seed=SEED):
+
+    """Treasury-like inventory as a dict of arrays with the keys of BOND: $1000 face, 0-7% coupons, semi-annual notes and bonds out to 30 years"""
+
+    rng = np.random.default_rng(seed)
+    coupon = np.round(rng.uniform(0, 0.07, n_bonds) * 800) / 800 # Coupons in 1/8 percent steps
+    maturity = rng.integers(1, 61, n_bonds) / 2
+    maturity[0] = 0.25                                # One note maturing within its first coupon period
+    return {"face": np.full(n_bonds, 1000.0), "coupon": coupon, "maturity": maturity, "freq": np.full(n_bonds, 2)}
+
+
+def carry_panel(n_dates, n_contracts, seed=SEED):
+
+    """Spot closes, (dates x contracts) futures closes at a 2% carry with noise, quarterly expiries rolling through the history, and the par yield history"""
+
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("1990-01-01", periods=n_dates)
+    spot = price_series(n_dates, seed=seed).set_axis(dates)
+    expiries = pd.date_range(dates[0], dates[-1] + pd.DateOffset(years=2), periods=n_contracts).date
+    T = (expiries.astype("datetime64[D]")[None, :] - dates.values.astype("datetime64[D]")[:, None]).astype(float) / 365.25
+    futures = spot.to_numpy()[:, None] * np.exp(0.02 * T) * (1 + rng.normal(0, 0.001, T.shape))
+    futures[T <= 0] = np.nan # Expired contracts stop trading
+    maturities, history = par_yield_history(n_dates, seed=seed)
+    return spot, pd.DataFrame(futures, index=dates, columns=[f"FUT{j}" for j in range(n_contracts)]), list(expiries), dates, maturities, history
+
+
+def futures_universe(n_contracts, contracts_per_asset=8, seed=SEED):
+
+    """ASSETS-like universe with quarterly contracts from Dec 2030 on (so that none expires whatever the day), and a quote for every ticker"""
+
+    rng = np.random.default_rng(seed)
+    expiries = [f"{code}{year}" for year in range(30, 40) for code in "HMUZ"][3:3 + contracts_per_asset]
+    assets, quotes = [], {}
+    for a in range(n_contracts // contracts_per_asset):
+        spot = 100 * rng.uniform(0.5, 2)
+        futures = [f"A{a:04d}{expiry}.SYN" for expiry in expiries]
+        assets.append({"name": f"ASSET{a}", "type": "commodity", "spot": f"A{a:04d}", "futures": futures})
+        quotes[f"A{a:04d}"] = spot
+        quotes.update({t: spot * rng.uniform(1.0, 1.2) for t in futures})
+    return assets, quotes
+
+
+def deliverable_basket(n_bonds, delivery_date=date(2026, 6, 1), seed=SEED):
+
+    """Synthetic T-bond futures basket: coupons, 15-30 year maturities on the 15th of Feb/May/Aug/Nov, and conversion factors at a 6% yield"""
+
+    from ch06_interest_rate_futures.ctd_bond_finder import DeliverableBond
+
+    rng = np.random.default_rng(seed)
+    basket = []
+    for i in range(n_bonds):
+        coupon = round(rng.uniform(1, 5) * 8) / 800 # Coupons in 1/8 percent steps
+        maturity = date(delivery_date.year + int(rng.integers(15, 30)), int(rng.choice([2, 5, 8, 11])), 15)
+        years = maturity.year - delivery_date.year
+        conversion_factor = coupon / 0.06 * (1 - 1.03 ** (-2 * years)) + 1.03 ** (-2 * years) # Annuity + principal at 3% per half-year
+        basket.append(DeliverableBond(coupon=coupon, maturity=maturity, conversion_factor=conversion_factor, cusip=f"SYN{i:06d}"))
+    return basket
+
+
+def credit_spread_pd(spread=0.011, recovery_rate=0.40, maturity=5):
+
+    """Cumulative default probability implied by a BBB-like credit spread, as in fetch_default_probability"""
+
+    pd_annual = spread / (1 - recovery_rate)
+    return 1 - (1 - pd_annual) ** maturity
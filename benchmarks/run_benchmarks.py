@@ -0,0 +1,279 @@
+"""Offline benchmark suite - times the hot paths of every chapter on synthetic fixtures and records wall time and peak memory run over run"""
+
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import tracemalloc
+import contextlib
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import matplotlib
+matplotlib.use("Agg") # Never open windows while benchmarking
+import numpy as np
+
+import fixtures
+from ch02_futures_markets.futures_margin_simulator import simulate_margin_account
+from ch03_hedging_futures.hedge_ratio_calculator import calculate_hedge_ratio, rolling_hedge_ratio, cross_hedge_matrix, minimum_variance_hedge
+from ch04_interest_rates.yield_curve_bootstrap import compute_zero_rates, compute_zero_rates_panel, CurvePanel, zero_rate_jacobian, ZeroCurve, price_bond, price_bond_portfolio, cash_flow_matrix, key_rate_dv01
+from ch05_forward_futures_pricing.implied_carry_calculator import implied_carry_panel, CarryScanner
+from ch06_interest_rate_futures.ctd_bond_finder import sort_bonds, ctd_sensitivity, make_forward_curve
+from ch07_swaps.currency_swap_pricer import SwapLeg, CurrencySwap, rate_sensitivity
+import ch08_securitization.cdo_tranche_pricer as cdo
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REGRESSION_THRESHOLD = 0.20 # Flag benchmarks more than 20% slower than the previous run
+
+
+# Each benchmark takes a size and returns the zero-argument callable to time, so that fixture construction is not timed
+
+def bench_simulate_margin_account(size):
+    pnl, calendar_days = fixtures.variation_margin(fixtures.PRICE_DAYS[size])
+    return lambda: simulate_margin_account(pnl, calendar_days, 8000, 0.75, 50_000, 0.05)
+
+
+def bench_calculate_hedge_ratio(size):
+    spot, futures = fixtures.hedge_pair(fixtures.PRICE_DAYS[size])
+    return lambda: calculate_hedge_ratio(spot, futures, plot=False)
+
+
+def bench_rolling_hedge_ratio(size):
+    spot, futures = fixtures.hedge_pair(fixtures.PRICE_DAYS[size])
+    return lambda: rolling_hedge_ratio(spot, futures)
+
+
+def bench_cross_hedge_matrix(size):
+    spot, futures = fixtures.hedge_universe(*fixtures.HEDGE_UNIVERSE[size])
+    return lambda: cross_hedge_matrix(spot, futures)
+
+
+def bench_minimum_variance_hedge(size):
+    spot, futures = fixtures.hedge_universe(*fixtures.HEDGE_UNIVERSE[size])
+    return lambda: minimum_variance_hedge(spot, futures, spot_sizes=1000, multipliers=100)
+
+
+def _zero_curve(size):
+    maturities = fixtures.CURVE_TENORS[size]
+    return maturities, compute_zero_rates(maturities, fixtures.par_yields(maturities))
+
+
+def bench_compute_zero_rates(size):
+    maturities = fixtures.CURVE_TENORS[size]
+    par_yields = fixtures.par_yields(maturities)
+    return lambda: compute_zero_rates(maturities, par_yields)
+
+
+def bench_compute_zero_rates_panel(size):
+    maturities, history = fixtures.par_yield_history(fixtures.CURVE_HISTORY_DAYS[size])
+    return lambda: compute_zero_rates_panel(maturities, history)
+
+
+def bench_zero_rate_jacobian(size):
+    maturities = fixtures.CURVE_TENORS[size]
+    par_yields = fixtures.par_yields(maturities)
+    return lambda: zero_rate_jacobian(maturities, par_yields)
+
+
+def bench_zero_curve(size):
+    maturities, zero_rates = _zero_curve(size)
+    t = np.linspace(0, 30, fixtures.PRICE_DAYS[size])
+    return lambda: ZeroCurve(maturities, zero_rates, interpolation="cubic").discount(t)
+
+
+def bench_price_bond(size):
+    curve = ZeroCurve(*_zero_curve("small"))
+    maturity, freq = fixtures.BOND_SHAPES[size]
+    bond = {"face": 1000, "coupon": 0.045, "maturity": maturity, "freq": freq}
+    return lambda: price_bond(curve, bond)
+
+
+def bench_price_bond_portfolio(size):
+    curve = ZeroCurve(*_zero_curve("small"))
+    bonds = fixtures.bond_inventory(fixtures.BOND_INVENTORY[size])
+    return lambda: price_bond_portfolio(curve, bonds)
+
+
+def bench_key_rate_dv01(size):
+    maturities = fixtures.CURVE_TENORS["small"]
+    zero_rates, jacobian = zero_rate_jacobian(maturities, fixtures.par_yields(maturities))
+    curve = ZeroCurve(maturities, zero_rates)
+    times, cash_flows = cash_flow_matrix(fixtures.bond_inventory(fixtures.BOND_INVENTORY[size]))
+    return lambda: key_rate_dv01(curve, jacobian, times, cash_flows)
+
+
+def bench_implied_carry_panel(size):
+    spot, futures, expiries, dates, maturities, history = fixtures.carry_panel(*fixtures.CARRY_PANEL[size])
+    curve_panel = CurvePanel(dates, maturities, history)
+    return lambda: implied_carry_panel(spot, futures, expiries, curve_panel)
+
+
+def bench_carry_scanner_update(size):
+    assets, quotes = fixtures.futures_universe(fixtures.FUTURES_UNIVERSE[size])
+    scanner = CarryScanner(assets, *_zero_curve("small"), assumptions={})
+    scanner.update(quotes)
+    ticks = [{t: p * 1.001} for t, p in list(quotes.items())[::100]] # One tick on 1% of the tickers, applied in turn
+    return lambda: [scanner.update(tick) for tick in ticks]
+
+
+def _ctd_inputs(size):
+    maturities, zero_rates = _zero_curve("small")
+    spot_fn = ZeroCurve(maturities, zero_rates, interpolation="cubic")
+    t0 = 0.25 # Fixed time to delivery, independent of the day the benchmark runs
+    return fixtures.deliverable_basket(fixtures.BASKET_SIZES[size]), spot_fn, t0
+
+
+def bench_sort_bonds(size):
+    basket, spot_fn, t0 = _ctd_inputs(size)
+    forward_fn = make_forward_curve(spot_fn, t0)
+    return lambda: sort_bonds(basket, 115.0, forward_fn)
+
+
+def bench_ctd_sensitivity(size):
+    basket, spot_fn, t0 = _ctd_inputs(size)
+    return lambda: ctd_sensitivity(basket, spot_fn, t0)
+
+
+def bench_ctd_scenario_grid(size):
+    basket, spot_fn, t0 = _ctd_inputs(size)
+    shifts = np.linspace(-0.03, 0.03, 1000)
+    return lambda: ctd_sensitivity(basket, spot_fn, t0, shifts)
+
+
+def _swap(size):
+    maturity, frequency = fixtures.SWAP_SHAPES[size]
+    maturities, zero_rates = _zero_curve("small")
+    domestic_curve = ZeroCurve(maturities, zero_rates, interpolation="cubic")
+    foreign_curve = domestic_curve.shift(-150)
+    domestic_leg = SwapLeg(100_000, "fixed", frequency, maturity, domestic_curve, 0.04)
+    foreign_leg = SwapLeg(100_000 / 1.08, "fixed", frequency, maturity, foreign_curve, 0.025)
+    return CurrencySwap(domestic_leg, foreign_leg, 1.08)
+
+
+def bench_swap_leg_pv(size):
+    swap = _swap(size)
+    floating_leg = SwapLeg(100_000, "floating", swap.domestic_leg.frequency, swap.domestic_leg.maturity, swap.domestic_leg.curve)
+    return lambda: (swap.domestic_leg.pv(), floating_leg.pv())
+
+
+def bench_compute_fair_rate(size):
+    swap = _swap(size)
+    swap.foreign_leg.rate = None
+    return lambda: swap.compute_fair_rate(solve_for="foreign")
+
+
+def bench_rate_sensitivity(size):
+    swap = _swap(size)
+    return lambda: rate_sensitivity(swap)
+
+
+def bench_simulate_portfolio_losses(size):
+    cdo.N_SIMULATIONS = fixtures.N_SIMULATIONS[size]
+    pd_cumulative = fixtures.credit_spread_pd()
+    return lambda: cdo.simulate_portfolio_losses(pd_cumulative)
+
+
+def bench_correlation_sensitivity(size):
+    cdo.N_SIMULATIONS = fixtures.N_SIMULATIONS[size]
+    pd_cumulative = fixtures.credit_spread_pd()
+    return lambda: cdo.correlation_sensitivity(pd_cumulative)
+
+
+BENCHMARKS = {
+    "simulate_margin_account":   bench_simulate_margin_account,
+    "calculate_hedge_ratio":     bench_calculate_hedge_ratio,
+    "rolling_hedge_ratio":       bench_rolling_hedge_ratio,
+    "cross_hedge_matrix":        bench_cross_hedge_matrix,
+    "minimum_variance_hedge":    bench_minimum_variance_hedge,
+    "compute_zero_rates":        bench_compute_zero_rates,
+    "compute_zero_rates_panel":  bench_compute_zero_rates_panel,
+    "zero_rate_jacobian":        bench_zero_rate_jacobian,
+    "zero_curve":                bench_zero_curve,
+    "price_bond":                bench_price_bond,
+    "price_bond_portfolio":      bench_price_bond_portfolio,
+    "key_rate_dv01":             bench_key_rate_dv01,
+    "implied_carry_panel":       bench_implied_carry_panel,
+    "carry_scanner_update":      bench_carry_scanner_update,
+    "sort_bonds":                bench_sort_bonds,
+    "ctd_sensitivity":           bench_ctd_sensitivity,
+    "ctd_scenario_grid":         bench_ctd_scenario_grid,
+    "swap_leg_pv":               bench_swap_leg_pv,
+    "compute_fair_rate":         bench_compute_fair_rate,
+    "rate_sensitivity":          bench_rate_sensitivity,
+    "simulate_portfolio_losses": bench_simulate_portfolio_losses,
+    "correlation_sensitivity":   bench_correlation_sensitivity,
+}
+
+
+def measure(fn, repeat):
+
+    """Best and median wall time over repeat runs, then peak traced memory of one extra run (tracing slows the code down, so it is kept out of the timings)"""
+
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()): # The chapter functions print their results
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {"best_s": min(timings), "median_s": float(np.median(timings)), "peak_mb": peak / 1e6}
+
+
+def load_previous():
+
+    """Results of the most recent earlier run, or {} if there is none"""
+
+    if not os.path.isdir(RESULTS_DIR):
+        return {}
+    runs = sorted(f for f in os.listdir(RESULTS_DIR) if f.endswith(".json"))
+    if not runs:
+        return {}
+    with open(os.path.join(RESULTS_DIR, runs[-1])) as f:
+        return json.load(f)["results"]
+
+
+def run(names, sizes, repeat):
+
+    previous = load_previous()
+    results = {}
+
+    print(f"{'Benchmark':<28}{'Size':<8}{'Best (ms)':>12}{'Median (ms)':>13}{'Peak (MB)':>11}{'vs last':>10}")
+    print("-" * 82)
+    for name in names:
+        for size in sizes:
+            key = f"{name}[{size}]"
+            results[key] = measure(BENCHMARKS[name](size), repeat)
+            change = ""
+            if key in previous:
+                ratio = results[key]["best_s"] / previous[key]["best_s"] - 1
+                change = f"{ratio:+.0%}" + (" !" if ratio > REGRESSION_THRESHOLD else "")
+            r = results[key]
+            print(f"{name:<28}{size:<8}{r['best_s'] * 1e3:>12.3f}{r['median_s'] * 1e3:>13.3f}{r['peak_mb']:>11.2f}{change:>10}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump({"repeat": repeat, "results": results}, f, indent=1)
+    print(f"\nResults saved to {os.path.relpath(path, ROOT)}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--sizes", nargs="+", choices=fixtures.SIZES, default=fixtures.SIZES, help="fixture sizes to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark (default: 5)")
+    args = parser.parse_args()
+
+    run(args.only, args.sizes, args.repeat)
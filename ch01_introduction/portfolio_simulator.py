@@ -1,9 +1,224 @@
 """Chapter 1: Introduction - portfolio simulator with multi-currency P&L and cumulative chart"""
 
 import os
+import csv
+import json
+from concurrent.futures import ThreadPoolExecutor
 import yfinance as yf
 import matplotlib.pyplot as plt
 import pandas as pd
+import numpy as np
+
+
+PRICE_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".price_store") # Shared by every chapter importing Asset
+
+
+
+class PriceStore:
+
+    """On-disk Parquet store of daily bars keyed by ticker, with the [start, end) ranges already downloaded. Bars are stored unadjusted and adjusted on read"""
+
+
+    def __init__(self, root=PRICE_STORE_DIR):
+        self.root = root
+
+    def _paths(self, ticker):
+        os.makedirs(self.root, exist_ok=True)
+        name = ticker.replace("/", "_").replace("=", "_").replace("^", "_") # Keep file names valid on every OS
+        return os.path.join(self.root, f"{name}.parquet"), os.path.join(self.root, f"{name}.json")
+
+    def _load_meta(self, ticker):
+        meta_path = self._paths(ticker)[1]
+        if not os.path.exists(meta_path):
+            return {"coverage": [], "currency": None}
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _save_meta(self, ticker, meta):
+        with open(self._paths(ticker)[1], "w") as f:
+            json.dump(meta, f, indent=1)
+
+    def _load_bars(self, ticker):
+        data_path = self._paths(ticker)[0]
+        return pd.read_parquet(data_path) if os.path.exists(data_path) else pd.DataFrame()
+
+    def _append(self, bars, new_bars, gap_start, gap_end, meta):
+        if new_bars is None or new_bars.empty:
+            return bars # Nothing traded (or unknown ticker): leave the range uncovered rather than caching an empty answer
+        today = pd.Timestamp.today().normalize()
+        meta["coverage"].append((gap_start.strftime("%Y-%m-%d"), min(gap_end, today).strftime("%Y-%m-%d"))) # Today's bar is not final yet, so it is never marked as covered
+        bars = new_bars if bars.empty else pd.concat([bars, new_bars])
+        return bars[~bars.index.duplicated(keep="last")].sort_index() # Sorted and unique, so that the next gap anchors on the right stored bars
+
+    def _refetch(self, ticker, start, end, meta):
+        """Download every covered range again together with [start, end), after a dividend or split changed the adjustment of the stored bars"""
+        if meta["coverage"]:
+            start, end = min(start, pd.Timestamp(meta["coverage"][0][0])), max(end, pd.Timestamp(meta["coverage"][-1][1]))
+        meta["coverage"] = []
+        return self._append(pd.DataFrame(), download_bars(ticker, start, end), start, end, meta)
+
+    def _save(self, ticker, bars, meta):
+        if not bars.empty:
+            bars.to_parquet(self._paths(ticker)[0])
+        meta["coverage"] = merge_ranges(meta["coverage"])
+        self._save_meta(ticker, meta)
+        return bars
+
+    def get(self, ticker, start_date, end_date):
+        """Return the adjusted daily bars of ticker in [start_date, end_date), downloading only the ranges missing from disk"""
+
+        start, end = pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize()
+        meta = self._load_meta(ticker)
+        bars = self._load_bars(ticker)
+
+        gaps = missing_ranges(start, end, meta["coverage"])
+        if gaps:
+            for gap_start, gap_end in gaps:
+                fetch_start, fetch_end = anchor_range(bars, gap_start, gap_end, meta["coverage"])
+                new_bars = download_bars(ticker, fetch_start, fetch_end)
+                if adjustment_changed(bars, new_bars, meta["coverage"]):
+                    bars = self._refetch(ticker, start, end, meta)
+                    break
+                bars = self._append(bars, new_bars, gap_start, gap_end, meta)
+            bars = self._save(ticker, bars, meta)
+
+        return adjust_bars(slice_bars(bars, start, end))
+
+    def get_many(self, tickers, start_date, end_date):
+        """Same as get for several tickers, with every ticker missing data fetched in a single batched download. Returns {ticker: bars}"""
+
+        start, end = pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize()
+        metas = {t: self._load_meta(t) for t in tickers}
+        gaps = {t: missing_ranges(start, end, metas[t]["coverage"]) for t in tickers}
+        stale = [t for t in tickers if gaps[t]]
+
+        if stale:
+            stored = {t: self._load_bars(t) for t in stale}
+            anchored = [anchor_range(stored[t], gaps[t][0][0], gaps[t][-1][1], metas[t]["coverage"]) for t in stale]
+            fetch_start = min(s for s, _ in anchored)  # One window spanning every gap: re-downloading a few covered days is cheaper than one call per gap
+            fetch_end = max(e for _, e in anchored)
+            batch = yf.download(stale, start=fetch_start, end=fetch_end, group_by="ticker", auto_adjust=False, progress=False)
+            for t in stale:
+                new_bars = None
+                if batch is not None and t in batch.columns.get_level_values(0):
+                    new_bars = batch[t].dropna(how="all") # Tickers from different exchanges share one date index, so drop the rows where this one did not trade
+                if adjustment_changed(stored[t], new_bars, metas[t]["coverage"]):
+                    self._save(t, self._refetch(t, start, end, metas[t]), metas[t])
+                else:
+                    self._save(t, self._append(stored[t], new_bars, fetch_start, fetch_end, metas[t]), metas[t])
+
+        return {t: self.get(t, start, end) for t in tickers} # Anything the batch failed to return falls back to a single-ticker download
+
+    def currency(self, ticker):
+        """Trading currency of ticker, looked up once and then read from the metadata file"""
+
+        meta = self._load_meta(ticker)
+        if meta.get("currency") is None:
+            meta["currency"] = yf.Ticker(ticker).info.get('currency', 'USD')
+            self._save_meta(ticker, meta)
+        return meta["currency"]
+
+
+def download_bars(ticker, start, end):
+
+    """Unadjusted daily bars of one ticker with their Adj Close, as single level columns"""
+
+    bars = yf.download(ticker, start=start, end=end, auto_adjust=False, progress=False)
+    if bars is not None and isinstance(bars.columns, pd.MultiIndex):
+        bars.columns = bars.columns.get_level_values(0) # Single ticker downloads still come back as (Price, Ticker) columns
+    return bars
+
+
+def covered_dates(index, coverage):
+
+    """Boolean mask of the dates of index inside the covered [start, end) ranges"""
+
+    mask = np.zeros(len(index), dtype=bool)
+    for cov_start, cov_end in coverage:
+        mask |= (index >= pd.Timestamp(cov_start)) & (index < pd.Timestamp(cov_end))
+    return mask
+
+
+def anchor_range(bars, gap_start, gap_end, coverage):
+
+    """[gap_start, gap_end) widened to the nearest covered bar on each side, so that the download overlaps the store on a known day"""
+
+    covered = bars.index[covered_dates(bars.index, coverage)] if not bars.empty else pd.DatetimeIndex([])
+    before, after = covered[covered < gap_start], covered[covered >= gap_end]
+    return (before[-1] if len(before) else gap_start), (after[0] + pd.Timedelta(days=1) if len(after) else gap_end)
+
+
+def adjustment_changed(bars, new_bars, coverage):
+
+    """True if the stored bars no longer match a fresh download on their common covered dates, or predate the Adj Close column"""
+
+    if bars.empty or new_bars is None or new_bars.empty:
+        return False
+    if "Adj Close" not in bars.columns:
+        return True
+    common = bars.index[covered_dates(bars.index, coverage)].intersection(new_bars.index)
+    columns = ["Close", "Adj Close"]
+    return not np.allclose(bars.loc[common, columns].to_numpy(dtype=float), new_bars.loc[common, columns].to_numpy(dtype=float), rtol=1e-6, equal_nan=True)
+
+
+def adjust_bars(bars):
+
+    """Scale the prices of unadjusted bars by Adj Close / Close, as yfinance does with auto_adjust"""
+
+    if bars.empty or "Adj Close" not in bars.columns:
+        return bars
+    factor = bars["Adj Close"] / bars["Close"]
+    prices = [c for c in ("Open", "High", "Low", "Close") if c in bars.columns]
+    bars[prices] = bars[prices].mul(factor, axis=0)
+    return bars.drop(columns="Adj Close")
+
+
+def slice_bars(bars, start_date, end_date):
+
+    """Rows of bars in [start_date, end_date), copied so that callers can convert prices in place without touching the store"""
+
+    if bars.empty:
+        return bars
+    start, end = pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize()
+    return bars.loc[(bars.index >= start) & (bars.index < end)].copy()
+
+
+def merge_ranges(ranges):
+
+    """Merge overlapping or touching [start, end) date ranges"""
+
+    merged = []
+    for start, end in sorted((pd.Timestamp(s), pd.Timestamp(e)) for s, e in ranges):
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(s.strftime("%Y-%m-%d"), e.strftime("%Y-%m-%d")) for s, e in merged]
+
+
+def missing_ranges(start, end, coverage):
+
+    """Sub-ranges of [start, end) not contained in the covered ranges"""
+
+    gaps = []
+    cursor = start
+    for cov_start, cov_end in merge_ranges(coverage):
+        cov_start, cov_end = pd.Timestamp(cov_start), pd.Timestamp(cov_end)
+        if cov_end <= cursor:
+            continue
+        if cov_start >= end:
+            break
+        if cov_start > cursor:
+            gaps.append((cursor, cov_start))
+        cursor = max(cursor, cov_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+PRICE_STORE = PriceStore()
 
 
 
@@ -11,28 +226,168 @@ class Asset:
 
     """Represents the financial asset corresponding to the ticker input by the user"""
 
+    fx_rate = None # Last FX rate applied by convert_to_usd, used to convert streamed bars (None when prices are not converted)
+
 
-    def __init__(self, ticker, start_date, end_date):
+    def __init__(self, ticker, start_date, end_date, data=None, currency=None, fx=None):
         self.ticker = ticker
-        self.data = self.fetch_data(start_date, end_date)
+        self.live_bars = [] # Bars received by append_bar, merged into data by flush_bars
+        self.data = self.fetch_data(start_date, end_date) if data is None else data # data, currency and fx can be preloaded for a whole portfolio by load_assets
         if not self.data.empty: print(f"Data for {self.ticker} from {start_date} to {end_date} fetched successfully.")
-        self.currency = yf.Ticker(ticker).info.get('currency', 'USD')
+        self.currency = PRICE_STORE.currency(ticker) if currency is None else currency
         if self.currency!= 'USD': 
-            self.convert_to_usd(start_date, end_date) 
+            self.convert_to_usd(start_date, end_date, fx) 
 
-    def convert_to_usd(self, start_date, end_date):
+    def convert_to_usd(self, start_date, end_date, fx=None):
         fx_pair= f"{self.currency}USD=X" 
-        fx = yf.download(fx_pair, start=start_date, end=end_date)['Close'].squeeze()
+        if fx is None:
+            fx_bars = PRICE_STORE.get(fx_pair, start_date, end_date)
+            fx = fx_bars['Close'] if not fx_bars.empty else pd.Series(dtype=float)
         if fx.empty: 
             print(f"Warning: No FX data found for {fx_pair}. Prices will not be converted to USD.") 
             return
         else: fx = fx.reindex(self.data.index).ffill().bfill() # Align FX data with asset data, forward and backward fill to handle any missing dates
         self.data['Close'] = self.data['Close'].squeeze() * fx 
+        self.fx_rate = float(fx.iloc[-1]) if len(fx) else None
         print(f"{self.ticker} prices converted from {self.currency} to USD.")
 
     def fetch_data(self, start_date, end_date):
-        return yf.download(self.ticker, start=start_date, end=end_date)
-    
+        return PRICE_STORE.get(self.ticker, start_date, end_date)
+
+    def close_prices(self):
+        return self.data['Close'].squeeze() #.squeeze() converts from DataFrame to Series if only one column, then we can do element-wise operations
+
+    def timestamps(self):
+        """Bar timestamps as int64 nanoseconds"""
+        return self.data.index.as_unit('ns').asi8
+
+    def append_bar(self, timestamp, close):
+        """Buffer a new bar (close in the trading currency, converted like the history) until flush_bars, and return the close as stored"""
+        if self.fx_rate is not None:
+            close = close * self.fx_rate
+        self.live_bars.append((pd.Timestamp(timestamp), close))
+        return close
+
+    def flush_bars(self):
+        """Merge the buffered bars into data in one concat, a repeated timestamp keeping its latest bar"""
+        if not self.live_bars:
+            return
+        timestamps, closes = zip(*self.live_bars)
+        new_bars = pd.DataFrame({'Close': closes}, index=pd.DatetimeIndex(timestamps, name=self.data.index.name))
+        data = pd.concat([self.data, new_bars])
+        self.data = data[~data.index.duplicated(keep='last')].sort_index()
+        self.live_bars = []
+
+
+
+def load_assets(specs, max_workers=8):
+
+    """Build one Asset per (ticker, start_date, end_date) in specs, with every price and FX pair fetched in one batched download"""
+
+    tickers = list(dict.fromkeys(ticker for ticker, _, _ in specs))  # Unique tickers, order preserved
+    start = min(pd.Timestamp(start_date) for _, start_date, _ in specs)
+    end = max(pd.Timestamp(end_date) for _, _, end_date in specs)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        currencies = dict(zip(tickers, pool.map(PRICE_STORE.currency, tickers)))
+
+    fx_pairs = {ccy: f"{ccy}USD=X" for ccy in set(currencies.values()) if ccy != 'USD'}
+    bars = PRICE_STORE.get_many(tickers + list(fx_pairs.values()), start, end)
+    fx = {ccy: bars[pair]['Close'] if not bars[pair].empty else pd.Series(dtype=float) for ccy, pair in fx_pairs.items()}
+
+    return [Asset(ticker, start_date, end_date, data=slice_bars(bars[ticker], start_date, end_date), currency=currencies[ticker], fx=fx.get(currencies[ticker]))
+            for ticker, start_date, end_date in specs]
+
+
+class Bars:
+
+    """Compact bar storage: float32 closes and optional int64 volumes over int64 nanosecond timestamps, saved as one .npy file per column"""
+
+
+    def __init__(self, timestamps, close, volume=None):
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.close = np.asarray(close, dtype=np.float32)
+        self.volume = None if volume is None else np.asarray(volume, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def from_frame(cls, data, with_volume=False):
+        """Keep only the close (and volume) of a yfinance download, at any interval"""
+        timestamps = pd.DatetimeIndex(data.index).as_unit('ns').asi8
+        volume = np.nan_to_num(np.ravel(data['Volume'])) if with_volume else None # np.ravel also flattens the single column (Price, Ticker) frames
+        return cls(timestamps, np.ravel(data['Close']), volume)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "timestamps.npy"), self.timestamps)
+        np.save(os.path.join(path, "close.npy"), self.close)
+        if self.volume is not None:
+            np.save(os.path.join(path, "volume.npy"), self.volume)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Read bars saved by save, memory-mapped (read only) by default"""
+        mode = "r" if mmap else None
+        volume_path = os.path.join(path, "volume.npy")
+        bars = cls.__new__(cls) # Bypass __init__ so that the arrays keep their memmap type
+        bars.timestamps = np.load(os.path.join(path, "timestamps.npy"), mmap_mode=mode)
+        bars.close = np.load(os.path.join(path, "close.npy"), mmap_mode=mode)
+        bars.volume = np.load(volume_path, mmap_mode=mode) if os.path.exists(volume_path) else None
+        return bars
+
+    def between(self, start, end):
+        """Bars in [start, end) as views on the same (possibly memory-mapped) arrays"""
+        i, j = np.searchsorted(self.timestamps, [pd.Timestamp(start).value, pd.Timestamp(end).value])
+        bars = Bars.__new__(Bars)
+        bars.timestamps, bars.close = self.timestamps[i:j], self.close[i:j]
+        bars.volume = None if self.volume is None else self.volume[i:j]
+        return bars
+
+    def append(self, timestamps, close, volume=None):
+        """New Bars with extra rows at the end (copies, so the result is no longer memory-mapped)"""
+        new_volume = None if self.volume is None else np.concatenate([self.volume, np.zeros(len(timestamps), dtype=np.int64) if volume is None else volume])
+        return Bars(np.concatenate([self.timestamps, timestamps]), np.concatenate([self.close, close]), new_volume)
+
+
+
+class IntradayAsset(Asset):
+
+    """Asset backed by Bars rather than a yfinance DataFrame, for large intraday histories. Prices are expected in USD already"""
+
+
+    def __init__(self, ticker, bars):
+        self.ticker = ticker
+        self.bars = bars
+        self.currency = 'USD'
+        self.live_bars = []
+
+    @classmethod
+    def load(cls, ticker, path, start_date=None, end_date=None):
+        bars = Bars.load(path)
+        if start_date is not None or end_date is not None:
+            bars = bars.between(start_date or bars.timestamps[0], end_date or bars.timestamps[-1] + 1)
+        return cls(ticker, bars)
+
+    def close_prices(self):
+        return self.bars.close
+
+    def timestamps(self):
+        return self.bars.timestamps
+
+    def flush_bars(self):
+        if not self.live_bars:
+            return
+        timestamps, closes = zip(*self.live_bars)
+        bars = self.bars.append(np.array([t.value for t in timestamps], dtype=np.int64), np.array(closes, dtype=np.float32))
+        if np.any(np.diff(bars.timestamps) <= 0):  # A repeated or late bar: keep the latest close of each timestamp, in time order
+            _, last = np.unique(bars.timestamps[::-1], return_index=True)
+            keep = len(bars) - 1 - last
+            bars = Bars(bars.timestamps[keep], bars.close[keep], None if bars.volume is None else bars.volume[keep])
+        self.bars = bars
+        self.live_bars = []
+
 
 
 class Position:
@@ -44,8 +399,9 @@ class Position:
         self.asset = asset
         self.size = size
         self.direction = direction
-        self.entry_price = asset.data['Close'].iloc[0].item()
-        self.exit_price = asset.data['Close'].iloc[-1].item()
+        prices = np.ravel(asset.close_prices())
+        self.entry_price = np.float64(prices[0]) # float64 scalar so that float32 intraday closes are upcast in the P&L arithmetic
+        self.exit_price = np.float64(prices[-1])
 
     def calculate_pnl(self):
         if self.direction == 'long':
@@ -56,18 +412,139 @@ class Position:
         
     def daily_cum_pnl(self): 
         if self.direction == 'long':
-            return (self.asset.data['Close'].squeeze() - self.entry_price) * self.size #.squeeze() converts from DataFrame to Series if only one column, then we can do element-wise operations
+            return (self.asset.close_prices() - self.entry_price) * self.size
         elif self.direction == 'short':
-            return (self.entry_price - self.asset.data['Close'].squeeze()) * self.size
+            return (self.entry_price - self.asset.close_prices()) * self.size
         else: raise ValueError("Direction must be 'long' or 'short'")
 
 
 
+class Portfolio:
+
+    """Positions held as one aligned (dates x positions) close price matrix plus size, entry price and direction sign vectors"""
+
+
+    def __init__(self, positions=()):
+        self.positions = list(positions)
+        self._build()
+
+    def add(self, position):
+        self.positions.append(position)
+        self._build()
+
+    def _build(self):
+        stamps = [pos.asset.timestamps() for pos in self.positions]
+        all_stamps = np.unique(np.concatenate(stamps)) if stamps else np.array([], dtype=np.int64)
+        self.dates = pd.DatetimeIndex(all_stamps.astype('datetime64[ns]'))
+
+        prices = np.full((len(all_stamps), len(stamps)), np.nan)
+        for j, pos in enumerate(self.positions):
+            prices[np.searchsorted(all_stamps, stamps[j]), j] = np.ravel(pos.asset.close_prices())
+        self.prices = ffill(prices) # Positions that stopped trading keep their last price, same as the forward fill on the P&L curves
+
+        for pos in self.positions:
+            if pos.direction not in ('long', 'short'): raise ValueError("Direction must be 'long' or 'short'")
+        self.sizes = np.array([pos.size for pos in self.positions], dtype=float)
+        self.entry_prices = np.array([pos.entry_price for pos in self.positions], dtype=float)
+        self.signs = np.array([1.0 if pos.direction == 'long' else -1.0 for pos in self.positions])
+
+    def daily_cum_pnl(self):
+        """(dates x positions) cumulative P&L, 0 before a position is opened"""
+        return np.nan_to_num((self.prices - self.entry_prices) * (self.signs * self.sizes))
+
+    def total_daily_cum_pnl(self):
+        return self.daily_cum_pnl().sum(axis=1)
+
+    def calculate_pnl(self):
+        """Final P&L of each position (its last row is the exit price once forward filled)"""
+        return self.daily_cum_pnl()[-1] if len(self.dates) else np.zeros(len(self.positions))
+
+    def to_frame(self):
+        """Cumulative P&L per position plus the portfolio total, labelled for plotting"""
+        labels = [f"{i+1}. {pos.direction.upper()} {pos.asset.ticker}" for i, pos in enumerate(self.positions)] # Use position number to allow for multiple positions in the same ticker without replacing columns in the df
+        pnl = self.daily_cum_pnl()
+        pnl_df = pd.DataFrame(pnl, index=self.dates, columns=labels)
+        pnl_df['Total Portfolio P&L'] = pnl.sum(axis=1)
+        return pnl_df
+
+
+class StreamingPnL:
+
+    """Running P&L of a Portfolio fed one bar at a time, each bar only touching the positions in its ticker.
+    Closes are in the ticker's trading currency, bars of an FX pair such as EURUSD=X set the rate used for the next ones"""
+
+
+    def __init__(self, portfolio):
+        self.portfolio = portfolio
+        self.pnl = portfolio.calculate_pnl().copy()
+        self.total = self.pnl.sum()
+        self._by_ticker = {}
+        for j, pos in enumerate(portfolio.positions):
+            self._by_ticker.setdefault(pos.asset.ticker, []).append(j)
+        self._assets = {pos.asset.ticker: pos.asset for pos in portfolio.positions} # One Asset per ticker receives the bar, even if several positions hold it
+        self._fx_assets = {}
+        for asset in self._assets.values():
+            if asset.fx_rate is not None:
+                self._fx_assets.setdefault(f"{asset.currency}USD=X", []).append(asset)
+
+    def update(self, timestamp, ticker, close):
+        """Apply one bar and return the new portfolio total. Bars for tickers not in the portfolio, other than its FX pairs, are ignored"""
+
+        for asset in self._fx_assets.get(ticker, ()):
+            asset.fx_rate = close
+        if ticker not in self._assets:
+            return self.total
+
+        close = self._assets[ticker].append_bar(timestamp, close) # In USD from here, like the portfolio's price matrix
+        portfolio = self.portfolio
+        for j in self._by_ticker[ticker]:
+            new_pnl = portfolio.signs[j] * portfolio.sizes[j] * (close - portfolio.entry_prices[j])
+            self.total += new_pnl - self.pnl[j]
+            self.pnl[j] = new_pnl
+            portfolio.positions[j].exit_price = close # Keeps Position.calculate_pnl in line with the stream
+        return self.total
+
+    def run(self, bars, callback=None):
+        """Consume (timestamp, ticker, close) bars, yielding (timestamp, ticker, total P&L) after each one and passing the same tuple to callback if given"""
+
+        for timestamp, ticker, close in bars:
+            total = self.update(timestamp, ticker, close)
+            if callback is not None:
+                callback(timestamp, ticker, total)
+            yield timestamp, ticker, total
+
+    def flush(self):
+        """Write the streamed bars into each Asset and rebuild the portfolio matrix, e.g. at the end of a session before plotting"""
+        for asset in self._assets.values():
+            asset.flush_bars()
+        self.portfolio._build()
+
+
+def replay_bars(path):
+
+    """Read a replay file of bars (CSV with timestamp, ticker, close columns) one line at a time, standing in for a live bar feed"""
+
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            yield pd.Timestamp(row["timestamp"]), row["ticker"], float(row["close"])
+
+
+def ffill(values):
+
+    """Forward fill the NaNs of a 2D array down each column"""
+
+    rows = np.where(np.isnan(values), 0, np.arange(values.shape[0])[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows) # Index of the last valid row seen so far in each column
+    return values[rows, np.arange(values.shape[1])]
+
+
+
 if __name__ == "__main__":
 
 
-    portfolio = []
+    positions = []
     portfolio_pnl = 0
+    specs, orders = [], []
 
     while True:
 
@@ -77,11 +554,6 @@ if __name__ == "__main__":
         ticker = input("Enter ticker symbol: ")
         start_date = input("Enter start date (YYYY-MM-DD): ")
         end_date = input("Enter end date (YYYY-MM-DD): ")
-        
-        asset = Asset(ticker, start_date, end_date)
-        if asset.data.empty:
-            print("No data found for that ticker/date range")
-            continue
 
         direction = input("Enter position direction (long/short): ").lower().strip()
         while direction not in ['long', 'short']: direction = input("Please enter 'long' or 'short': ").lower().strip()
@@ -92,22 +564,27 @@ if __name__ == "__main__":
             print("Please enter a valid number for position size.")
             continue
 
-        position = Position(asset, size, direction)
-        portfolio.append(position)
+        specs.append((ticker, start_date, end_date))
+        orders.append((size, direction))
+
+    if specs: # Prices for every position are downloaded together once the portfolio is complete
+        for asset, (size, direction) in zip(load_assets(specs), orders):
+            if asset.data.empty:
+                print(f"No data found for {asset.ticker} over that date range, position skipped")
+                continue
+            positions.append(Position(asset, size, direction))
 
-    for pos in portfolio:
-        pnl = pos.calculate_pnl()
+    portfolio = Portfolio(positions)
+    for pos, pnl in zip(portfolio.positions, portfolio.calculate_pnl()):
         portfolio_pnl += pnl
         print(f"{pos.direction.upper()} position in {pos.asset.ticker} has a P&L of: ${pnl:.2f}")
 
     print(f"\nTotal Portfolio P&L: ${portfolio_pnl:.2f}\n")
 
 
-    if portfolio: # Only plot if there are positions in the portfolio
+    if portfolio.positions: # Only plot if there are positions in the portfolio
 
-        pnl_df = pd.DataFrame({f"{i+1}. {pos.direction.upper()} {pos.asset.ticker}": pos.daily_cum_pnl() for i, pos in enumerate(portfolio)}) # Use position number to allow for multiple positions in the same ticker without replacing columns in the df
-        pnl_df = pnl_df.ffill().fillna(0) # Forward fill to handle different date ranges, then fill any remaining NaNs with 0. Necessary to align the P&L curves for plotting and ensure the portfolio P&L is cumulative across all positions
-        pnl_df['Total Portfolio P&L'] = pnl_df.sum(axis=1)
+        pnl_df = portfolio.to_frame() # Different date ranges are aligned on one date index: P&L is 0 before a position opens and stays at its final value after it closes
 
         ax = pnl_df.drop(columns=['Total Portfolio P&L']).plot(figsize=(12, 6), grid = True, alpha = 0.7, title = "Cumulative P&L of Portfolio Over Time", xlabel = "Date", ylabel = "Cumulative P&L ($)")
         pnl_df['Total Portfolio P&L'].plot(ax=ax, label='Total Portfolio P&L', color='black', linewidth=2) # Plot total portfolio P&L separately as a bold black line
@@ -2,9 +2,12 @@
 
 import sys
 import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ch01_introduction"))
-from portfolio_simulator import Asset, Position
+from portfolio_simulator import Asset, Position, Portfolio, ffill, load_assets
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 
 
@@ -18,8 +21,8 @@ class FuturesPosition(Position):
         self.multiplier = multiplier
 
     def daily_pnl(self):
-        prices = self.asset.data["Close"].squeeze()
-        daily_changes = prices.diff().dropna()
+        prices = self.asset.close_prices()
+        daily_changes = prices.diff().dropna() if isinstance(prices, pd.Series) else np.diff(prices.astype(np.float64)) # Bars-backed assets return a plain float32 array
         if self.direction == "long":
             return daily_changes * self.size * self.multiplier
         if self.direction == "short":
@@ -29,33 +32,329 @@ class FuturesPosition(Position):
 
 # Implement the margin account simulation logic
 
-def simulate_margin_account(variation_margin, initial_margin, maintenance_margin_requirement, capital):
-    margin_calls = {}
-    margin_account = pd.Series(index=variation_margin.index, dtype=float)
-    margin_account.iloc[0] = initial_margin
-    total_interest = 0
-
-    current_balance = initial_margin
-    for date, pnl in variation_margin.items():
-        interest = current_balance * (interest_rate / 360) * calendar_days[date] # Dividing the annual rate by 360 is the convention for most money markets instruments / Interest accrues on the opening balance (before today's variation margin is settled)
-        current_balance += pnl + interest
-        total_interest += interest
-        margin_account[date] = current_balance
-
-        if current_balance < maintenance_margin_requirement * initial_margin:
-            top_up = initial_margin - current_balance
-            margin_calls[date] = top_up
-            
-            if top_up > capital:
-                print(f"\nInsufficient capital to meet margin call. Position liquidated on {date.date()}")
+MARGIN_STEP_DAYS = 16 # Days of each segment between margin calls simulated one by one before switching to vectorised blocks
+
+
+def simulate_margin_account(variation_margin, calendar_days, initial_margin, maintenance_margin_requirement, capital, interest_rate):
+
+    """Simulate the margin account from daily variation margin and calendar days since the previous settlement, initial_margin being fixed or one value per day.
+    Returns (balances, call_indices, call_amounts, remaining_capital, total_interest, liquidation_index), liquidation_index being None if the position survives"""
+
+    pnl = np.asarray(variation_margin, dtype=float)
+    growth = 1 + (interest_rate / 360) * np.asarray(calendar_days, dtype=float) # Dividing the annual rate by 360 is the convention for most money markets instruments / Interest accrues on the opening balance (before today's variation margin is settled)
+    G = np.cumprod(growth)
+    W = np.cumsum(pnl / G) # Between two calls the balance is b_t = G_t * (b_open / G_(s-1) + W_t - W_(s-1))
+    n = len(pnl)
+    initial_margin = np.broadcast_to(np.asarray(initial_margin, dtype=float), (n,))
+    threshold = maintenance_margin_requirement * initial_margin
+
+    balances = np.empty(n)
+    call_indices, call_amounts = [], []
+    liquidation_index = None
+
+    pnl_list, growth_list, margin_list, threshold_list = pnl.tolist(), growth.tolist(), initial_margin.tolist(), threshold.tolist()
+    start, balance = 0, margin_list[0]
+    while start < n:
+        # Step through the first days of the segment, where most calls land, then scan blocks of doubling length until the first breach
+        call = None
+        for t in range(start, min(start + MARGIN_STEP_DAYS, n)):
+            balance = growth_list[t] * balance + pnl_list[t]
+            balances[t] = balance # Balances are recorded before the top-up
+            if balance < threshold_list[t]:
+                call = t
                 break
-            else: 
-                capital -= top_up
-                current_balance += top_up
+        else:
+            offset = balance / G[t] - W[t]
+            stop, block = t + 1, MARGIN_STEP_DAYS
+            while stop < n:
+                lo, stop = stop, min(stop + block, n)
+                balances[lo:stop] = G[lo:stop] * (offset + W[lo:stop])
+                below = np.flatnonzero(balances[lo:stop] < threshold[lo:stop])
+                if len(below):
+                    call = lo + below[0]
+                    break
+                block *= 2
+        if call is None:
+            break
+
+        t = call
+        top_up = margin_list[t] - balances[t]
+        call_indices.append(t)
+        call_amounts.append(top_up)
+        if top_up > capital:
+            liquidation_index = t
+            balances = balances[:t + 1]
+            break
+        capital -= top_up
+        start, balance = t + 1, margin_list[t]
+
+    # Interest earned each day on the opening balance, i.e. the previous close after any top-up
+    closing = balances.copy()
+    reset = [i for i in call_indices if i != liquidation_index]
+    closing[reset] = initial_margin[reset]
+    opening = np.concatenate([[initial_margin[0]], closing[:-1]])
+    total_interest = float((opening * (growth[:len(balances)] - 1)).sum())
+
+    return balances, np.array(call_indices, dtype=int), np.array(call_amounts), capital, total_interest, liquidation_index
+
+
+
+
+# Parameter sweep over a grid of margin parameters and contracts
+
+_SWEEP_PATHS = {} # Price paths of the sweep, set once per worker process by _init_sweep_worker
+
+
+def _init_sweep_worker(paths):
+    global _SWEEP_PATHS
+    _SWEEP_PATHS = paths
+
+
+def _run_sweep_chunk(points):
+    rows = []
+    for ticker, initial_margin, maintenance_margin_requirement, interest_rate, capital in points:
+        dates, variation_margin, calendar_days = _SWEEP_PATHS[ticker]
+        row = {"ticker": ticker, "initial_margin": initial_margin, "maintenance_margin": maintenance_margin_requirement,
+               "interest_rate": interest_rate, "capital": capital, "funded": initial_margin <= capital,
+               "liquidation_date": pd.NaT, "n_calls": 0, "total_interest": np.nan, "final_pnl": np.nan}
+        if row["funded"]: # Otherwise the position can't even be opened
+            balances, call_indices, _, remaining, total_interest, liquidation_index = simulate_margin_account(
+                variation_margin, calendar_days, initial_margin, maintenance_margin_requirement, capital - initial_margin, interest_rate)
+            row.update(n_calls=len(call_indices), total_interest=total_interest, final_pnl=balances[-1] + remaining - capital,
+                       liquidation_date=dates[liquidation_index] if liquidation_index is not None else pd.NaT)
+        rows.append(row)
+    return rows
+
+
+def margin_parameter_sweep(tickers, start_date, end_date, size, direction, multipliers, initial_margins, maintenance_margins, interest_rates, capitals, max_workers=None):
+
+    """Simulate the margin account for every combination of ticker, initial margin, maintenance margin, interest rate and capital over a process pool.
+    multipliers is one value for every ticker or a {ticker: multiplier} dict. Returns one row per grid point"""
+
+    sign = 1 if direction == "long" else -1
+    paths = {}
+    for asset in load_assets([(ticker, start_date, end_date) for ticker in tickers]):
+        if len(asset.timestamps()) == 0:
+            print(f"No data found for {asset.ticker}, skipped")
+            continue
+        multiplier = multipliers[asset.ticker] if isinstance(multipliers, dict) else multipliers
+        prices = np.ravel(asset.close_prices())
+        dates = pd.to_datetime(asset.timestamps()) # Shared accessors, so Bars-backed intraday assets work too
+        variation_margin = np.concatenate([[0], sign * np.diff(prices) * size * multiplier]) # Day one settles with a pnl of 0, as in the single simulation
+        calendar_days = np.concatenate([[1], np.diff(dates.values).astype("timedelta64[D]").astype(int)])
+        paths[asset.ticker] = (dates, variation_margin, calendar_days)
+
+    grid = list(itertools.product(paths, initial_margins, maintenance_margins, interest_rates, capitals))
+    max_workers = max_workers or os.cpu_count()
+    chunk_size = max(1, -(-len(grid) // (4 * max_workers))) # About four chunks per worker balances the load without paying for one task per grid point
+    chunks = [grid[i:i + chunk_size] for i in range(0, len(grid), chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_sweep_worker, initargs=(paths,)) as pool:
+        rows = [row for chunk_rows in pool.map(_run_sweep_chunk, chunks) for row in chunk_rows]
+    return pd.DataFrame(rows)
+
+
+
+
+# SPAN-style portfolio margin for a book of futures positions
+
+# (price move as a fraction of the price scan range, volatility move, weight). Volatility moves only matter for options, so the
+# futures losses of each pair of up/down volatility scenarios are equal. The last two are the extreme moves, covered at 35%
+SPAN_SCENARIOS = np.array([
+    (0,    +1, 1.0), (0,    -1, 1.0),
+    (1/3,  +1, 1.0), (1/3,  -1, 1.0), (-1/3, +1, 1.0), (-1/3, -1, 1.0),
+    (2/3,  +1, 1.0), (2/3,  -1, 1.0), (-2/3, +1, 1.0), (-2/3, -1, 1.0),
+    (1,    +1, 1.0), (1,    -1, 1.0), (-1,   +1, 1.0), (-1,   -1, 1.0),
+    (3,     0, 0.35), (-3,    0, 0.35),
+])
+
+
+def commodity_root(ticker):
+
+    """Commodity group of a futures ticker: ROOT + MONTH_LETTER + TWO_DIGIT_YEAR + .EXCHANGE -> ROOT"""
+
+    return ticker.split(".")[0][:-3]
+
+
+def price_scan_ranges(prices, multipliers, scan_sigmas=3, vol_window=60):
+
+    """Per contract dollar price scan range for each day: scan_sigmas daily standard deviations of the log returns over the last vol_window days, times price and multiplier"""
+
+    log_returns = np.diff(np.log(prices), axis=0)
+    valid = ~np.isnan(log_returns)
+    log_returns = np.where(valid, log_returns, 0)
+
+    def rolling_sum(x):
+        c = np.concatenate([np.zeros((1, x.shape[1])), np.cumsum(x, axis=0)])
+        return c[1:] - c[np.maximum(np.arange(1, len(c)) - vol_window, 0)]
+
+    n = rolling_sum(valid.astype(float))
+    s1, s2 = rolling_sum(log_returns), rolling_sum(log_returns ** 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sigma = np.sqrt(np.maximum(s2 - s1 ** 2 / n, 0) / (n - 1))
+    sigma[n < 2] = np.nan
+    sigma = np.vstack([sigma[:1], sigma])               # No return yet on the first day: reuse the next day's estimate
+    sigma = ffill(ffill(sigma)[::-1])[::-1]             # Days before enough history borrow the first available estimate
+    return np.nan_to_num(scan_sigmas * sigma * prices * multipliers)
+
 
+def span_margin(positions, groups=None, spread_credits=(), scan_sigmas=3, vol_window=60):
 
-    margin_account = margin_account.dropna()
-    return margin_account, margin_calls, capital, total_interest
+    """SPAN-style daily margin of a book of FuturesPositions: worst SPAN_SCENARIOS loss of each commodity group (the ticker root by default),
+    less spread_credits given as {"legs": (group_a, group_b), "ratio": (delta_a, delta_b), "rate": credit_rate}. Returns (dates, requirement, variation_margin)"""
+
+    portfolio = Portfolio(positions)
+    multipliers = np.array([pos.multiplier for pos in positions], dtype=float)
+    groups = [commodity_root(pos.asset.ticker) for pos in positions] if groups is None else list(groups)
+    group_names = list(dict.fromkeys(groups))
+    membership = np.array([[g == name for name in group_names] for g in groups], dtype=float) # (contracts x groups) one-hot matrix
+
+    prices = portfolio.prices
+    scan = price_scan_ranges(prices, multipliers, scan_sigmas, vol_window)
+    last_rows = np.searchsorted(portfolio.dates.asi8, [pos.asset.timestamps()[-1] for pos in positions]) # Last bar of each contract, i.e. its expiry
+    held = ~np.isnan(prices) & (np.arange(len(prices))[:, None] <= last_rows)
+    signed_contracts = np.where(held, portfolio.signs * portfolio.sizes, 0) # A position counts from its first price to its last one, not on forward filled prices after expiry
+
+    price_moves, _, weights = SPAN_SCENARIOS.T
+    losses = -(signed_contracts * scan)[:, None, :] * (price_moves * weights)[None, :, None] # (days x scenarios x contracts)
+    scanning_risk = np.maximum((losses @ membership).max(axis=1), 0)                       # (days x groups): worst scenario per group, never negative
+
+    deltas = signed_contracts @ membership
+    remaining = np.abs(deltas)
+    credits = np.zeros(len(prices))
+    for spread in spread_credits:
+        a, b = (group_names.index(g) for g in spread["legs"])
+        ratio_a, ratio_b = spread.get("ratio", (1, 1))
+        opposite = np.sign(deltas[:, a]) * np.sign(deltas[:, b]) < 0
+        n_spreads = np.where(opposite, np.minimum(remaining[:, a] / ratio_a, remaining[:, b] / ratio_b), 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            risk_per_delta_a = np.nan_to_num(scanning_risk[:, a] / np.abs(deltas[:, a]))
+            risk_per_delta_b = np.nan_to_num(scanning_risk[:, b] / np.abs(deltas[:, b]))
+        credits += spread["rate"] * n_spreads * (ratio_a * risk_per_delta_a + ratio_b * risk_per_delta_b)
+        remaining[:, a] -= n_spreads * ratio_a # Deltas used by one spread are not available to the next ones
+        remaining[:, b] -= n_spreads * ratio_b
+
+    requirement = scanning_risk.sum(axis=1) - credits
+    variation_margin = np.concatenate([[0], np.nan_to_num(np.diff(prices, axis=0)) @ (portfolio.signs * portfolio.sizes * multipliers)]) # Day one settles with a pnl of 0
+    return portfolio.dates, requirement, variation_margin
+
+
+
+
+# Monte Carlo stress test of the margin account over simulated price paths
+
+TRADING_DAYS = 252
+CALENDAR_DAYS_PER_TRADING_DAY = 365 / TRADING_DAYS # Average calendar days between two settlements, used for interest on simulated paths
+
+
+def simulate_price_paths(historical_prices, n_paths, n_days, method="gbm", block_size=10, seed=None):
+
+    """(n_paths x n_days + 1) price paths from the last historical price: "gbm" on the historical drift and volatility, "bootstrap" of the daily log returns,
+    or "block_bootstrap" of block_size consecutive returns to keep volatility clustering"""
+
+    rng = np.random.default_rng(seed)
+    prices = np.asarray(historical_prices, dtype=float)
+    log_returns = np.diff(np.log(prices))
+
+    if method == "gbm":
+        steps = rng.normal(log_returns.mean(), log_returns.std(ddof=1), size=(n_paths, n_days)) # Mean of log returns already includes the -sigma^2/2 drift correction
+    elif method == "bootstrap":
+        steps = log_returns[rng.integers(0, len(log_returns), size=(n_paths, n_days))]
+    elif method == "block_bootstrap":
+        block_size = min(block_size, len(log_returns))
+        n_blocks = -(-n_days // block_size) # Ceiling division
+        starts = rng.integers(0, len(log_returns) - block_size + 1, size=(n_paths, n_blocks))
+        steps = log_returns[(starts[:, :, None] + np.arange(block_size)).reshape(n_paths, -1)[:, :n_days]]
+    else:
+        raise ValueError("Method must be 'gbm', 'bootstrap' or 'block_bootstrap'")
+
+    paths = np.empty((n_paths, n_days + 1))
+    paths[:, 0] = 0
+    np.cumsum(steps, axis=1, out=paths[:, 1:])
+    return prices[-1] * np.exp(paths)
+
+
+def stress_margin_account(variation_margin, calendar_days, initial_margin, maintenance_margin_requirement, capital, interest_rate):
+
+    """simulate_margin_account on a (paths x days) variation margin matrix, plus the funding each path needs to survive without liquidation"""
+
+    n_paths, n_days = variation_margin.shape
+    growth = 1 + (interest_rate / 360) * np.asarray(calendar_days, dtype=float)
+    threshold = maintenance_margin_requirement * initial_margin
+
+    balance = np.full(n_paths, float(initial_margin))
+    capital_left = np.full(n_paths, float(capital))
+    alive = np.ones(n_paths, dtype=bool)
+    n_calls = np.zeros(n_paths, dtype=int)
+    top_ups = np.zeros(n_paths)
+    liquidation_day = np.full(n_paths, -1)
+    unconstrained_balance = balance.copy()
+    funding_required = np.zeros(n_paths)
+
+    for t in range(n_days):
+        balance = np.where(alive, balance * growth[t] + variation_margin[:, t], balance) # Liquidated paths stay frozen at their last balance
+        call = alive & (balance < threshold)
+        top_up = np.where(call, initial_margin - balance, 0)
+        liquidated = call & (top_up > capital_left)
+        met = call & ~liquidated
+
+        n_calls += call
+        liquidation_day[liquidated] = t
+        alive &= ~liquidated
+        top_ups += np.where(met, top_up, 0)
+        capital_left -= np.where(met, top_up, 0)
+        balance = np.where(met, initial_margin, balance)
+
+        unconstrained_balance = unconstrained_balance * growth[t] + variation_margin[:, t]
+        unconstrained_call = unconstrained_balance < threshold
+        funding_required += np.where(unconstrained_call, initial_margin - unconstrained_balance, 0)
+        unconstrained_balance = np.where(unconstrained_call, initial_margin, unconstrained_balance)
+
+    return {
+        "final_balance": balance,
+        "remaining_capital": capital_left,
+        "n_calls": n_calls,
+        "top_ups": top_ups,
+        "funding_required": funding_required,
+        "liquidation_day": liquidation_day,
+    }
+
+
+def margin_stress_test(historical_prices, size, direction, multiplier, initial_margin, maintenance_margin_requirement, capital, interest_rate,
+                       n_paths=100_000, n_days=TRADING_DAYS, method="gbm", block_size=10, chunk_size=20_000, seed=None):
+
+    """Simulate n_paths price paths and the resulting margin accounts, in chunks of paths to bound memory. Returns the per-path results of stress_margin_account"""
+
+    sign = 1 if direction == "long" else -1
+    calendar_days = np.full(n_days + 1, CALENDAR_DAYS_PER_TRADING_DAY)
+    calendar_days[0] = 1 # Same as the historical simulation, day one accrues a single day of interest
+    rng = np.random.default_rng(seed)
+
+    chunks = []
+    for start in range(0, n_paths, chunk_size):
+        paths = simulate_price_paths(historical_prices, min(chunk_size, n_paths - start), n_days, method, block_size, rng)
+        variation_margin = np.zeros_like(paths)
+        variation_margin[:, 1:] = sign * np.diff(paths, axis=1) * size * multiplier # Day one settles at the opening price with a pnl of 0
+        chunks.append(stress_margin_account(variation_margin, calendar_days, initial_margin, maintenance_margin_requirement, capital, interest_rate))
+
+    return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+
+
+def print_stress_summary(results):
+
+    """Print the distribution of margin calls, top-ups, funding required and liquidations"""
+
+    percentiles = [5, 50, 95, 99]
+    liquidated = results["liquidation_day"] >= 0
+    print(f"\nMonte Carlo stress test ({len(liquidated):,} paths)")
+    print(f"{'':<22}{'mean':>12}" + "".join(f"{f'p{q}':>12}" for q in percentiles))
+    for label, key in [("Margin calls", "n_calls"), ("Total top-ups ($)", "top_ups"), ("Funding required ($)", "funding_required")]:
+        values = results[key]
+        print(f"{label:<22}{values.mean():>12.2f}" + "".join(f"{v:>12.2f}" for v in np.percentile(values, percentiles)))
+    print(f"\nProbability of liquidation: {liquidated.mean():.2%}")
+    if liquidated.any():
+        days = results["liquidation_day"][liquidated]
+        print(f"Liquidation day (trading days from start): median {np.median(days):.0f}, p5 {np.percentile(days, 5):.0f}, p95 {np.percentile(days, 95):.0f}")
 
 
 
@@ -101,15 +400,18 @@ if __name__ == "__main__":
 
     position = FuturesPosition(underlying, size, direction, multiplier)
     
-    variation_margin = position.daily_pnl() # We have the right series, but starting at the second trading day with the first pnl value. We need to initialise at tradi ng day 1 with a pnl of 0.
-    first_trading_day = position.asset.data["Close"].squeeze().index[0] 
-    variation_margin = pd.concat([pd.Series([0], index=[first_trading_day]), variation_margin])
+    variation_margin = np.asarray(position.daily_pnl(), dtype=float) # We have the right series, but starting at the second trading day with the first pnl value. We need to initialise at trading day 1 with a pnl of 0.
+    variation_margin = pd.Series(np.concatenate([[0], variation_margin]), index=pd.to_datetime(position.asset.timestamps()))
 
     dates = variation_margin.index
     calendar_days = dates.to_series().diff().dt.days.fillna(1) # Get the series of how many calendar days there are between each date (useful to compute interest)
 
 
-    margin_account, margin_calls, capital, total_interest = simulate_margin_account(variation_margin, initial_margin, maintenance_margin_requirement, capital)
+    balances, call_indices, call_amounts, capital, total_interest, liquidation_index = simulate_margin_account(variation_margin.to_numpy(), calendar_days.to_numpy(), initial_margin, maintenance_margin_requirement, capital, interest_rate)
+    if liquidation_index is not None:
+        print(f"\nInsufficient capital to meet margin call. Position liquidated on {dates[liquidation_index].date()}")
+    margin_account = pd.Series(balances, index=dates[:len(balances)])
+    margin_calls = dict(zip(dates[call_indices], call_amounts))
     variation_margin = variation_margin[:margin_account.index[-1]]
     total_pnl = margin_account.iloc[-1] + capital - initial_capital
 
@@ -151,4 +453,19 @@ if __name__ == "__main__":
     ax.grid(True, alpha=0.3)
     plt.tight_layout()
     plt.savefig(os.path.join(os.path.dirname(os.path.abspath(__file__)), "margin_account.png"), dpi=150, bbox_inches="tight")
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+
+
+
+    # Optional Monte Carlo stress test on simulated paths
+
+    stress = input("\nRun a Monte Carlo stress test of the margin account? (yes/no): ").lower().strip()
+    while stress not in ['yes', 'no']: stress = input("Please enter 'yes' or 'no': ").lower().strip()
+    if stress == 'yes':
+        method = input("Path generation method (gbm/bootstrap/block_bootstrap): ").lower().strip()
+        while method not in ['gbm', 'bootstrap', 'block_bootstrap']: method = input("Please enter 'gbm', 'bootstrap' or 'block_bootstrap': ").lower().strip()
+        n_paths = int(input("Number of paths: "))
+        results = margin_stress_test(position.asset.close_prices(), size, direction, multiplier, initial_margin, maintenance_margin_requirement,
+                                     initial_capital - initial_margin, interest_rate, n_paths=n_paths, n_days=len(dates) - 1, method=method)
+        print_stress_summary(results)
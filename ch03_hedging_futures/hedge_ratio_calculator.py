@@ -3,7 +3,7 @@
 import sys
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ch01_introduction"))
-from portfolio_simulator import Asset, Position
+from portfolio_simulator import Position, load_assets
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
@@ -11,8 +11,9 @@ from scipy import stats
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
+MIN_OBSERVATIONS = 63   # Shortest common sample (about 3 months of trading days) minimum_variance_hedge will regress on
 
-def calculate_hedge_ratio(spot_prices, futures_prices):
+def calculate_hedge_ratio(spot_prices, futures_prices, plot=True):
 
     """Calculate h_star as the slope of the linear regression of spot price changes against futures price changes in the past 6 months before the start date of the hedge"""
 
@@ -29,6 +30,9 @@ def calculate_hedge_ratio(spot_prices, futures_prices):
 
     # Plot regression
 
+    if not plot:
+        return h_star, rho, effectiveness
+
     plt.scatter(futures_delta, spot_delta)
     plt.plot(futures_delta, h_star*futures_delta, label=f'Regression (h_star={h_star:.2f})')
     plt.xlabel('Delta futures')
@@ -44,6 +48,171 @@ def calculate_hedge_ratio(spot_prices, futures_prices):
 
 
 
+def paired_deltas(spot_prices, futures_prices):
+
+    """Daily changes of spot and futures, centred on the days where both are known and set to 0 elsewhere, plus the 0/1 mask of those days"""
+
+    spot_delta = np.diff(spot_prices.to_numpy(dtype=float), axis=0)
+    futures_delta = np.diff(futures_prices.to_numpy(dtype=float), axis=0)
+    valid = ~(np.isnan(spot_delta) | np.isnan(futures_delta))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        count = valid.sum(axis=0)
+        spot_delta = np.where(valid, spot_delta - np.where(valid, spot_delta, 0).sum(axis=0) / count, 0) # Centring keeps the cumulative sums small
+        futures_delta = np.where(valid, futures_delta - np.where(valid, futures_delta, 0).sum(axis=0) / count, 0)
+    return spot_delta, futures_delta, valid.astype(float)
+
+
+def rolling_hedge_ratio(spot_prices, futures_prices, window=126):
+
+    """h_star, rho and effectiveness for every date, each estimated on the `window` daily price changes ending at that date (126 trading days is about 6 months).
+    Accepts two Series, or two DataFrames with one column per (spot, futures) pair. Changes with a missing price are left out of their windows only"""
+
+
+    spot_prices, futures_prices = spot_prices.align(futures_prices, join='inner', axis=0)
+    spot_delta, futures_delta, valid = paired_deltas(spot_prices, futures_prices)
+
+    def window_sums(v):
+        c = np.cumsum(v, axis=0)
+        c = np.concatenate([np.zeros((1,) + v.shape[1:]), c])
+        return c[window:] - c[:-window]
+
+    n = window_sums(valid)
+    sum_x, sum_y = window_sums(futures_delta), window_sums(spot_delta)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov_xy = window_sums(futures_delta * spot_delta) - sum_x * sum_y / n
+        var_x = window_sums(futures_delta ** 2) - sum_x ** 2 / n
+        var_y = window_sums(spot_delta ** 2) - sum_y ** 2 / n
+        h_star = np.where(n >= 2, cov_xy / var_x, np.nan)
+        rho = np.where(n >= 2, cov_xy / np.sqrt(var_x * var_y), np.nan)
+
+    dates = spot_prices.index[window:]  # Each window is labelled with the date of its last price change
+    wrap = (lambda a: pd.Series(a, index=dates)) if spot_prices.ndim == 1 else (lambda a: pd.DataFrame(a, index=dates, columns=spot_prices.columns))
+    return wrap(h_star), wrap(rho), wrap(rho ** 2)
+
+
+
+
+def cross_hedge_matrix(spot_prices, futures_prices):
+
+    """h_star, rho and effectiveness of every spot asset against every futures contract (one DataFrame column each), as three (spots x futures) DataFrames"""
+
+    spot_prices, futures_prices = spot_prices.align(futures_prices, join='inner', axis=0)
+    spot_delta = np.diff(spot_prices.to_numpy(dtype=float), axis=0)
+    futures_delta = np.diff(futures_prices.to_numpy(dtype=float), axis=0)
+    spot_valid, futures_valid = ~np.isnan(spot_delta), ~np.isnan(futures_delta)
+    spot_delta = np.where(spot_valid, spot_delta - np.nanmean(spot_delta, axis=0), 0) # Centring keeps the sums small, missing changes count as 0
+    futures_delta = np.where(futures_valid, futures_delta - np.nanmean(futures_delta, axis=0), 0)
+    spot_valid, futures_valid = spot_valid.astype(float), futures_valid.astype(float)
+
+    # Each pair is estimated on the dates where both of its prices are known: masked sums over (spots x futures) via matrix products
+    n = spot_valid.T @ futures_valid
+    sum_spot, sum_futures = spot_delta.T @ futures_valid, spot_valid.T @ futures_delta
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = spot_delta.T @ futures_delta - sum_spot * sum_futures / n
+        var_spot = (spot_delta ** 2).T @ futures_valid - sum_spot ** 2 / n
+        var_futures = spot_valid.T @ futures_delta ** 2 - sum_futures ** 2 / n
+        h_star = np.where(n >= 2, cov / var_futures, np.nan)
+        rho = np.where(n >= 2, cov / np.sqrt(var_spot * var_futures), np.nan)
+
+    wrap = lambda a: pd.DataFrame(a, index=spot_prices.columns, columns=futures_prices.columns)
+    return wrap(h_star), wrap(rho), wrap(rho ** 2)
+
+
+def rank_hedges(h_star, rho, effectiveness, top=1):
+
+    """Best `top` futures contracts for each spot exposure, ranked by hedge effectiveness (R^2). Returns one row per (spot, rank)"""
+
+    order = np.argsort(-effectiveness.to_numpy(), axis=1)[:, :top]
+    rows = []
+    for i, spot in enumerate(effectiveness.index):
+        for rank, j in enumerate(order[i], start=1):
+            rows.append({"spot": spot, "rank": rank, "futures": effectiveness.columns[j],
+                         "h_star": h_star.iat[i, j], "rho": rho.iat[i, j], "effectiveness": effectiveness.iat[i, j]})
+    return pd.DataFrame(rows).set_index(["spot", "rank"])
+
+
+
+
+def minimum_variance_hedge(spot_prices, futures_prices, spot_sizes=1, multipliers=1):
+
+    """Regress the spot price changes of each exposure on the changes of several futures at once (e.g. a strip of maturities), spot_sizes being signed.
+    Returns the (futures x exposures) h_star, the signed number of contracts of each future and the share of each exposure's P&L variance removed.
+    Series with fewer than MIN_OBSERVATIONS prices, then the sparsest futures, are left out (NaN exposures, 0 contracts) until the common sample is long enough"""
+
+    spot_prices = spot_prices.to_frame() if spot_prices.ndim == 1 else spot_prices
+    prices = pd.concat([spot_prices, futures_prices], axis=1, join='inner')
+    counts = prices.count()
+    spots = [c for c in spot_prices.columns if counts[c] >= MIN_OBSERVATIONS]
+    futures = sorted((c for c in futures_prices.columns if counts[c] >= MIN_OBSERVATIONS), key=lambda c: -counts[c])
+    while futures and len(prices[spots + futures].dropna()) < MIN_OBSERVATIONS:
+        futures.pop()                                # Dropping a sparse instrument keeps more dates than dropping dates for every instrument
+    common = prices[spots + futures].dropna()
+    if not spots or not futures or len(common) < MIN_OBSERVATIONS:
+        raise ValueError(f"Fewer than {MIN_OBSERVATIONS} common prices between the exposures and any of the futures")
+    spot_delta = np.diff(common[spots].to_numpy(dtype=float), axis=0)
+    futures_delta = np.diff(common[futures].to_numpy(dtype=float), axis=0)
+
+    spot_delta -= spot_delta.mean(axis=0)           # Centring is equivalent to fitting an intercept
+    futures_delta -= futures_delta.mean(axis=0)
+    h_star, *_ = np.linalg.lstsq(futures_delta, spot_delta, rcond=None) # (futures x exposures), one factorisation for every right-hand side
+
+    residuals = spot_delta - futures_delta @ h_star
+    variance_reduction = 1 - (residuals ** 2).sum(axis=0) / (spot_delta ** 2).sum(axis=0)
+
+    spot_sizes = pd.Series(np.broadcast_to(np.asarray(spot_sizes, dtype=float), (spot_prices.shape[1],)), index=spot_prices.columns)[spots]
+    multipliers = pd.Series(np.broadcast_to(np.asarray(multipliers, dtype=float), (futures_prices.shape[1],)), index=futures_prices.columns)[futures]
+    contracts = -h_star * spot_sizes.to_numpy()[None, :] / multipliers.to_numpy()[:, None] # Hedge in the opposite direction of the exposure
+
+    wrap = lambda a: pd.DataFrame(a, index=futures, columns=spots).reindex(columns=spot_prices.columns).reindex(index=futures_prices.columns, fill_value=0)
+    return wrap(h_star), wrap(contracts), pd.Series(variance_reduction, index=spots).reindex(spot_prices.columns)
+
+
+
+
+def walk_forward_backtest(spot_prices, futures_prices, estimation_windows=(63, 126, 252), holding_periods=(21, 63, 126)):
+
+    """Backtest the static hedge of the script for every start date, estimation window and holding period (in trading days) at once.
+    Returns one row per (start date, estimation window, holding period) with h_star, the in-sample effectiveness and the realised variance reduction"""
+
+    spot_prices, futures_prices = spot_prices.align(futures_prices, join='inner')
+    dates = spot_prices.index
+    spot_delta, futures_delta, valid = paired_deltas(spot_prices, futures_prices)
+
+    sums = {name: np.concatenate([[0], np.cumsum(v)]) for name, v in
+            {"n": valid, "x": futures_delta, "y": spot_delta, "xx": futures_delta ** 2, "yy": spot_delta ** 2, "xy": futures_delta * spot_delta}.items()}
+
+    def moments(start, stop):
+        """(co)variances times the number of valid changes over the changes [start, stop), for arrays of window bounds"""
+        s = {name: c[stop] - c[start] for name, c in sums.items()}
+        n = np.where(s["n"] >= 2, s["n"], np.nan)
+        return s["xx"] - s["x"] ** 2 / n, s["yy"] - s["y"] ** 2 / n, s["xy"] - s["x"] * s["y"] / n
+
+    frames = []
+    n_changes = len(spot_delta)
+    for window in estimation_windows:
+        for holding in holding_periods:
+            # Change i moves the price from dates[i] to dates[i+1]. The script estimates on prices before the start date, i.e. changes [s - window - 1, s - 1)
+            starts = np.arange(window + 1, n_changes - holding + 1)
+            if len(starts) == 0:
+                continue
+            var_x, var_y, cov_xy = moments(starts - window - 1, starts - 1)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                h_star = cov_xy / var_x
+                effectiveness = cov_xy ** 2 / (var_x * var_y)
+                hold_var_f, hold_var_s, hold_cov = moments(starts, starts + holding)
+                hedged_var = hold_var_s - 2 * h_star * hold_cov + h_star ** 2 * hold_var_f
+                variance_reduction = 1 - hedged_var / hold_var_s
+            frames.append(pd.DataFrame({
+                "start_date": dates[starts], "end_date": dates[starts + holding],
+                "estimation_window": window, "holding_period": holding,
+                "h_star": h_star, "effectiveness": effectiveness, "variance_reduction": variance_reduction,
+            }))
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+
+
 if __name__ == "__main__":
 
     ticker_spot = input("Please input the ticker of the spot asset you want to hedge: ")
@@ -60,13 +229,13 @@ if __name__ == "__main__":
         print("The hedge will occur in the future and cannot be backtested.")
         sys.exit(1)
 
-    spot = Asset(ticker_spot, start_date, backtest_end_date)
-    futures = Asset(ticker_futures, start_date, backtest_end_date)
-
-
     estimation_start = start_dt - relativedelta(months=6)
-    spot_est = Asset(ticker_spot, estimation_start, start_date)
-    futures_est = Asset(ticker_futures, estimation_start, start_date)
+    spot, futures, spot_est, futures_est = load_assets([
+        (ticker_spot, start_date, backtest_end_date),
+        (ticker_futures, start_date, backtest_end_date),
+        (ticker_spot, estimation_start, start_date),
+        (ticker_futures, estimation_start, start_date),
+    ]) # Both tickers are downloaded once over the estimation and hedge windows, then sliced
     spot_prices = spot_est.data['Close'].squeeze()
     futures_prices = futures_est.data['Close'].squeeze()
 
@@ -1,8 +1,13 @@
 """Chapter 4: Interest Rates - yield curve bootstrapping, forward rates computation, and bond pricing"""
 
 import os
+import io
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 import matplotlib.pyplot as plt
 from scipy.interpolate import CubicSpline
 
@@ -24,6 +29,10 @@ FRED_SERIES = [
 ]
 
 FRED_URL = "https://fred.stlouisfed.org/graph/fredgraph.csv?id={}"
+FRED_LOOKBACK_DAYS = 30  # Only request the last month of observations, enough to cover holidays and publication lags
+
+CURVE_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".curve_store") # Shared by every chapter loading the Treasury curve
+CURVE_MAX_AGE_DAYS = 0   # FRED publishes one curve per business day: check for a new one once the latest snapshot was last checked on an earlier day
 
 BOND = {
     "face":     1000,   # face value ($)
@@ -33,28 +42,58 @@ BOND = {
 }
 
 
-def fetch_treasury_yields():
+def fred_session():
+
+    """requests Session with a connection pool large enough to download every FRED series concurrently"""
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=len(FRED_SERIES)))
+    session.mount("http://", HTTPAdapter(pool_maxsize=len(FRED_SERIES)))
+    return session
+
+
+def fetch_fred_series(session, series_id, url=FRED_URL, start_date=None):
+
+    """Download one FRED series as a float Series (NaN where FRED reports "."), from start_date onwards if given"""
+
+    params = {"cosd": start_date.isoformat()} if start_date is not None else None # cosd = observation start date
+    response = session.get(url.format(series_id), params=params, timeout=10)
+    response.raise_for_status()
+    data = pd.read_csv(io.StringIO(response.text), index_col=0, na_values=".")
+    return data.iloc[:, 0].astype(float)
+
+
+def fetch_latest_yield(session, series_id, url=FRED_URL, start_date=None):
+
+    """(date, yield) of the last valid observation of a FRED yield series, the yield in decimal"""
+
+    values = fetch_fred_series(session, series_id, url, start_date).dropna()
+    if values.empty and start_date is not None:
+        values = fetch_fred_series(session, series_id, url).dropna() # Nothing published in the window: fall back to the full history
+    return pd.Timestamp(values.index[-1]).date(), values.iloc[-1] / 100 # Divide by 100 to turn percentages into decimal values
+
+
+def fetch_treasury_yields(url=FRED_URL, lookback_days=FRED_LOOKBACK_DAYS):
 
-    """Fetch the latest available US Treasury CMT yields from FRED. FRED returns bond-equivalent yields (BEY, compounded twice a year as a convention) in percent."""
+    """Fetch the latest available US Treasury CMT yields from FRED, requested concurrently for the last lookback_days only. Returns (maturities, yields, as_of),
+    as_of being the latest observation date. FRED returns bond-equivalent yields (BEY, compounded twice a year as a convention) in percent"""
 
-    maturities, yields = [], []
+    start_date = date.today() - timedelta(days=lookback_days)
+    maturities, yields, observed = [], [], []
     print("Fetching US Treasury yields from FRED...")
-    for T, series_id in FRED_SERIES:
-        try:
-            response = requests.get(FRED_URL.format(series_id), timeout=10)
-            response.raise_for_status()
-            lines = response.text.strip().split("\n")[1:]  # skip header row
-            for line in reversed(lines):                   # get the last updated data first to keep the latest yield
-                parts = line.split(",")
-                if len(parts) == 2 and parts[1].strip() not in (".", ""):
-                    value = float(parts[1]) / 100          # Divide by 100 to turn percentages into decimal values
+    with fred_session() as session:
+        with ThreadPoolExecutor(max_workers=len(FRED_SERIES)) as pool:
+            requests_by_series = [(T, series_id, pool.submit(fetch_latest_yield, session, series_id, url, start_date)) for T, series_id in FRED_SERIES]
+            for T, series_id, request in requests_by_series: # Results are collected in maturity order
+                try:
+                    observation_date, value = request.result()
                     maturities.append(T)
                     yields.append(value)
+                    observed.append(observation_date)
                     print(f"  {series_id:8s} ({T:6.3f}Y): {value * 100:.2f}%")
-                    break
-        except Exception as e:
-            print(f"  {series_id} skipped: {e}")
-    return np.array(maturities), np.array(yields)
+                except Exception as e:
+                    print(f"  {series_id} skipped: {e}")
+    return np.array(maturities), np.array(yields), max(observed, default=None)
 
 
 # compounding conversions:
@@ -98,6 +137,50 @@ def compute_zero_rates(maturities, par_yields):
     return zero_rates
 
 
+def interp_weights(t, maturities):
+
+    """np.interp(t, maturities, values) as (k, w) with the same result as (1 - w) * values[k] + w * values[k + 1], flat beyond both ends"""
+
+    maturities = np.asarray(maturities, dtype=float)
+    t = np.clip(t, maturities[0], maturities[-1])
+    k = np.clip(np.searchsorted(maturities, t, side="right") - 1, 0, len(maturities) - 2)
+    w = (t - maturities[k]) / (maturities[k + 1] - maturities[k])
+    return k, w
+
+
+def zero_rate_jacobian(maturities, par_yields):
+
+    """Zero rates and their Jacobian J[i, k] = d zero_rates[i] / d par_yields[k], carrying each gradient through the same bootstrap as compute_zero_rates"""
+
+    maturities = np.asarray(maturities, dtype=float)
+    par_yields = np.asarray(par_yields, dtype=float)
+    zero_rates = bey_to_cc(par_yields)
+    jacobian = np.diag(1 / (1 + par_yields / 2)) # d bey_to_cc(y) / dy
+    for i, (T, y) in enumerate(zip(maturities, par_yields)):
+        if T <= 0.5:
+            continue
+
+        n_coupons = int(round(T * 2))
+        c = y / 2
+        dc = np.zeros(len(maturities))
+        dc[i] = 0.5                                         # the coupon only depends on its own par yield
+
+        t = np.arange(1, n_coupons) * 0.5
+        k, w = interp_weights(t, maturities)
+        r = (1 - w) * zero_rates[k] + w * zero_rates[k + 1]
+        dr = (1 - w)[:, None] * jacobian[k] + w[:, None] * jacobian[k + 1]
+        discounts = np.exp(-r * t)
+        pv_coupons = c * discounts.sum()
+        dpv_coupons = dc * discounts.sum() - c * (t * discounts) @ dr
+
+        df = (1 - pv_coupons) / (1 + c)
+        ddf = (-dpv_coupons * (1 + c) - (1 - pv_coupons) * dc) / (1 + c) ** 2
+        zero_rates[i] = -np.log(df) / T
+        jacobian[i] = -ddf / (df * T)
+
+    return zero_rates, jacobian
+
+
 def compute_forward_rates(maturities, zero_rates):
 
     """Calculate forward rates between each maturity from zero rates"""
@@ -110,6 +193,172 @@ def compute_forward_rates(maturities, zero_rates):
     return forward_rates
 
 
+def compute_zero_rates_panel(maturities, par_yields):
+
+    """compute_zero_rates for a (dates x maturities) par yield matrix at once, each row bootstrapped on its available tenors (NaN where a tenor is missing)"""
+
+    maturities = np.asarray(maturities, dtype=float)
+    par_yields = np.asarray(par_yields, dtype=float)
+    valid = ~np.isnan(par_yields)
+    zero_rates = bey_to_cc(par_yields)     # exact for T ≤ 0.5Y (zero-coupon T-bills); estimate for longer maturities, this serves as an initialization.
+
+    for i, T in enumerate(maturities):
+        if T <= 0.5:
+            continue
+
+        n_coupons = int(round(T * 2))
+        c = par_yields[:, i:i + 1] / 2                    # semi-annual coupon per $1 face value, one per date
+        t = np.arange(1, n_coupons) * 0.5                 # all payment times except the last one
+
+        # Same result as np.interp(t, available maturities, zero_rates) on each date, including the flat extrapolation at both ends
+        filled = fill_missing_tenors(maturities, zero_rates)
+        k, w = interp_weights(t, maturities)
+        r_t = (1 - w) * filled[:, k] + w * filled[:, k + 1]
+
+        pv_coupons = (c * np.exp(-r_t * t)).sum(axis=1, keepdims=True)
+        df = (1 - pv_coupons) / (1 + c)
+        zero_rates[:, i] = np.where(valid[:, i], -np.log(df[:, 0]) / T, np.nan)
+
+    return zero_rates
+
+
+def compute_forward_rates_panel(maturities, zero_rates):
+
+    """compute_forward_rates for every row of a (dates x maturities) zero rate matrix. NaN where either end of the interval is missing on that date"""
+
+    maturities = np.asarray(maturities, dtype=float)
+    rT = zero_rates * maturities
+    return np.diff(rT, axis=1) / np.diff(maturities)
+
+
+def fill_missing_tenors(maturities, rates):
+
+    """Fill the NaN tenors of each row of a (dates x maturities) matrix as np.interp on that row's available tenors would (NaN if there is none)"""
+
+    maturities = np.asarray(maturities, dtype=float)
+    rates = np.asarray(rates, dtype=float)
+    n_tenors = rates.shape[1]
+    valid = ~np.isnan(rates)
+    tenor_index = np.broadcast_to(np.arange(n_tenors), rates.shape)
+    lower = np.maximum.accumulate(np.where(valid, tenor_index, -1), axis=1)
+    upper = np.minimum.accumulate(np.where(valid, tenor_index, n_tenors)[:, ::-1], axis=1)[:, ::-1]
+    lower, upper = np.where(lower >= 0, lower, upper), np.where(upper < n_tenors, upper, lower) # Beyond the available tenors, both sides are the nearest one
+    lower, upper = np.clip(lower, 0, n_tenors - 1), np.clip(upper, 0, n_tenors - 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weight = np.where(maturities[upper] > maturities[lower], (maturities - maturities[lower]) / (maturities[upper] - maturities[lower]), 0)
+    rows = np.arange(len(rates))[:, None]
+    return rates[rows, lower] + weight * (rates[rows, upper] - rates[rows, lower])
+
+
+class CurvePanel:
+
+    """History of par yield, zero and forward curves, one row per date over the FRED tenors, saved as one float32 .npy file per array"""
+
+
+    def __init__(self, dates, maturities, par_yields, zero_rates=None, forward_rates=None):
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+        self.maturities = np.asarray(maturities, dtype=float)
+        self.par_yields = np.asarray(par_yields) # Plain arrays (e.g. from the fetch_treasury_history DataFrame), while memory-mapped ones are not copied
+        self.zero_rates = compute_zero_rates_panel(maturities, self.par_yields) if zero_rates is None else np.asarray(zero_rates)
+        self.forward_rates = compute_forward_rates_panel(maturities, self.zero_rates) if forward_rates is None else np.asarray(forward_rates)
+
+    def curve(self, as_of):
+        """(maturities, par_yields, zero_rates) of the last date on or before as_of, restricted to the tenors available that day"""
+        i = np.searchsorted(self.dates, np.datetime64(as_of, "D"), side="right") - 1
+        if i < 0:
+            raise ValueError(f"No curve on or before {as_of}")
+        available = ~np.isnan(self.zero_rates[i])
+        return self.maturities[available], self.par_yields[i][available].astype(float), self.zero_rates[i][available].astype(float)
+
+    def save(self, path, dtype=np.float32):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "dates.npy"), self.dates)
+        np.save(os.path.join(path, "maturities.npy"), self.maturities)
+        for name in ("par_yields", "zero_rates", "forward_rates"):
+            np.save(os.path.join(path, f"{name}.npy"), np.asarray(getattr(self, name), dtype=dtype))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in ("dates", "maturities", "par_yields", "zero_rates", "forward_rates")}
+        return cls(**arrays)
+
+
+def fetch_treasury_history(url=FRED_URL, start_date=None):
+
+    """Full daily history of the FRED par yields as a (dates x maturities) DataFrame in decimal, NaN where a tenor was not published. Columns are the maturities in years"""
+
+    with fred_session() as session:
+        with ThreadPoolExecutor(max_workers=len(FRED_SERIES)) as pool:
+            series = list(pool.map(lambda s: fetch_fred_series(session, s[1], url, start_date), FRED_SERIES))
+    history = pd.concat(series, axis=1) / 100
+    history.columns = [T for T, _ in FRED_SERIES]
+    history.index = pd.to_datetime(history.index)
+    return history.dropna(how="all").sort_index() # Days where no tenor was published (holidays) carry no curve
+
+
+class CurveStore:
+
+    """Snapshots of the bootstrapped Treasury curve, one .npz file of par yields, zero rates and forward rates per as-of date"""
+
+    def __init__(self, root=CURVE_STORE_DIR):
+        self.root = root
+
+    def _path(self, as_of):
+        return os.path.join(self.root, f"{as_of.isoformat()}.npz")
+
+    def dates(self):
+        """As-of dates of every stored snapshot, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(date.fromisoformat(f[:-4]) for f in os.listdir(self.root) if f.endswith(".npz"))
+
+    def save(self, as_of, maturities, par_yields, zero_rates, forward_rates):
+        os.makedirs(self.root, exist_ok=True)
+        np.savez(self._path(as_of), maturities=maturities, par_yields=par_yields, zero_rates=zero_rates, forward_rates=forward_rates)
+
+    def fetched_on(self, as_of):
+        """Day the snapshot of as_of was last written or confirmed against FRED"""
+        return date.fromtimestamp(os.path.getmtime(self._path(as_of)))
+
+    def touch(self, as_of):
+        os.utime(self._path(as_of))
+
+    def load(self, as_of=None):
+        """(as_of, maturities, par_yields, zero_rates, forward_rates) of the last snapshot on or before as_of (the latest one if None), or None if there is none"""
+        dates = [d for d in self.dates() if as_of is None or d <= as_of]
+        if not dates:
+            return None
+        with np.load(self._path(dates[-1])) as snapshot:
+            return (dates[-1],) + tuple(snapshot[name] for name in ("maturities", "par_yields", "zero_rates", "forward_rates"))
+
+
+CURVE_STORE = CurveStore()
+
+
+def load_treasury_curve(max_age_days=CURVE_MAX_AGE_DAYS, refresh=False, store=CURVE_STORE):
+
+    """(maturities, par_yields, zero_rates, forward_rates) of the latest snapshot, fetched from FRED again if refresh is True, if there is none
+    or if it was last checked more than max_age_days ago (None keeps it whatever its age). Snapshots are keyed by the FRED observation date"""
+
+    today = date.today()
+    snapshot = None if refresh else store.load()
+    if snapshot is not None and (max_age_days is None or (today - store.fetched_on(snapshot[0])).days <= max_age_days):
+        print(f"Using the Treasury curve snapshot of {snapshot[0]}")
+        return snapshot[1:]
+
+    maturities, par_yields, as_of = fetch_treasury_yields()
+    zero_rates = compute_zero_rates(maturities, par_yields)
+    forward_rates = compute_forward_rates(maturities, zero_rates)
+    if len(maturities) != len(FRED_SERIES):
+        print("Some tenors are missing: the curve is used but not saved as a snapshot") # A partial curve would otherwise be served all day
+    elif as_of in store.dates() and not refresh:
+        store.touch(as_of) # Nothing newer published (weekend or holiday): keep the stored curve, checked today
+    else:
+        store.save(as_of, maturities, par_yields, zero_rates, forward_rates)
+    return maturities, par_yields, zero_rates, forward_rates
+
+
 def plot_curves(maturities, par_yields, zero_rates, forward_rates):
 
     """Plot yield curve, zero curve and forward rates curve (all in BEY %)"""
@@ -138,9 +387,68 @@ def plot_curves(maturities, par_yields, zero_rates, forward_rates):
     plt.show()
 
 
-def price_bond(curve_maturities, zero_rates, bond):
-
-    """Price a bond by discounting each cash flow at the interpolated zero rate."""
+class ZeroCurve:
+
+    """CC zero curve evaluated once ("linear" as np.interp or "cubic" as CubicSpline) on a daily grid plus its maturities, then queried by np.interp on the grid"""
+
+    GRID_STEP = 1 / 365      # Daily grid: linear interpolation between grid points stays within 1e-9 of the cubic spline
+    EXTRAPOLATION_YEARS = 2  # The grid extrapolates the interpolant this far past the last maturity, rates are held flat beyond it (a cubic runs away quickly)
+
+    def __init__(self, maturities, zero_rates, interpolation="linear"):
+        self.maturities = np.asarray(maturities, dtype=float)
+        self.zero_rates = np.asarray(zero_rates, dtype=float)
+        self.interpolation = interpolation
+        start = min(0.0, self.maturities[0])
+        end = self.maturities[-1] + self.EXTRAPOLATION_YEARS
+        self.grid = np.union1d(np.arange(start, end + self.GRID_STEP, self.GRID_STEP), self.maturities)
+        self.weight_spline = None
+        if interpolation == "linear":
+            rates = np.interp(self.grid, self.maturities, self.zero_rates)
+        elif interpolation == "cubic":
+            rates = CubicSpline(self.maturities, self.zero_rates)(self.grid)
+            self.weight_spline = CubicSpline(self.maturities, np.eye(len(self.maturities))) # Spline of each pillar's unit vector, for rate_weights
+        else:
+            raise ValueError(f"Unknown interpolation: {interpolation}")
+        self.grid_rates = rates
+
+    def rate(self, t):
+        """CC zero rate(s) at t (years), scalar or array"""
+        return np.interp(t, self.grid, self.grid_rates)
+
+    __call__ = rate # Drop-in for a CubicSpline of the zero rates
+
+    def discount(self, t):
+        return np.exp(-self.rate(t) * t)
+
+    def rate_weights(self, t):
+        """(len(t) x maturities) matrix W with rate(t) = W @ zero_rates: both interpolants are linear in the zero rates"""
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        if self.interpolation == "linear":
+            k, w = interp_weights(t, self.maturities)
+            weights = np.zeros((len(t), len(self.maturities)))
+            weights[np.arange(len(t)), k] = 1 - w
+            weights[np.arange(len(t)), k + 1] = w
+            return weights
+        return self.weight_spline(np.clip(t, self.grid[0], self.grid[-1])) # Same flat extrapolation as rate() beyond the grid
+
+    def forward(self, t1, t2):
+        """CC forward rate(s) between t1 and t2, element-wise on arrays"""
+        if np.any(np.asarray(t2) == t1):
+            raise ValueError("Forward rate over an empty period: t1 and t2 must differ")
+        return (self.rate(t2) * t2 - self.rate(t1) * t1) / (np.asarray(t2) - t1)
+
+    def shift(self, bps):
+        """Curve with every zero rate shifted in parallel by bps basis points. The grid is shifted directly, the interpolant is not rebuilt"""
+        shifted = ZeroCurve.__new__(ZeroCurve)
+        shifted.maturities, shifted.interpolation, shifted.grid, shifted.weight_spline = self.maturities, self.interpolation, self.grid, self.weight_spline
+        shifted.zero_rates = self.zero_rates + bps / 10_000
+        shifted.grid_rates = self.grid_rates + bps / 10_000
+        return shifted
+
+
+def price_bond(curve, bond):
+
+    """Price a bond by discounting each cash flow at the zero rate of a ZeroCurve."""
     # We are pricing a Treasury bond so using zero rates derived from Treasury Yields is appropriate. For derivatives pricing though, we would use OIS rates.
 
     face     = bond["face"]
@@ -151,24 +459,91 @@ def price_bond(curve_maturities, zero_rates, bond):
     n_coupons  = int(round(maturity * freq)) # total number of coupon payments
     cf_per_period = coupon / freq * face     # coupon cash flow per period
 
-    price = 0
-    for j in range(1, n_coupons + 1):
-        t_j = j / freq                                         # payment date in years
-        r_j = np.interp(t_j, curve_maturities, zero_rates)     # zero rate at t_j (CC)
-        cf  = cf_per_period + (face if j == n_coupons else 0)  # add face value on last payment
-        price += cf * np.exp(-r_j * t_j)
+    t = np.arange(1, n_coupons + 1) / freq   # payment dates in years
+    cash_flows = np.full(n_coupons, cf_per_period)
+    cash_flows[-1] += face                   # add face value on last payment
+
+    return cash_flows @ curve.discount(t)
+
+
+def cash_flow_matrix(bonds):
+
+    """Padded (bonds x payments) matrices of payment times (years) and amounts, from bonds with the keys of BOND as arrays (a dict of arrays or a DataFrame)"""
+
+    face, coupon, maturity, freq = (np.atleast_1d(np.asarray(bonds[key], dtype=float)) for key in ("face", "coupon", "maturity", "freq"))
+    n_coupons = np.maximum(np.round(maturity * freq).astype(int), 1) # total number of coupon payments per bond, at least the final one
+
+    j = np.arange(1, n_coupons.max() + 1)               # payment number, shared by all bonds
+    paid = j <= n_coupons[:, None]
+    times = np.where(paid, maturity[:, None] - (n_coupons[:, None] - j) / freq[:, None], 0.0) # counted back from maturity, so a bond maturing within one period pays at maturity
+    cash_flows = np.where(paid, (coupon / freq * face)[:, None], 0.0)
+    cash_flows[np.arange(len(face)), n_coupons - 1] += face # add face value on last payment
+    return times, cash_flows
+
+
+def bond_yields(prices, times, cash_flows, freq, tol=1e-12, max_iter=50):
+
+    """Yields to maturity (compounded freq times a year, so BEY for semi-annual bonds) solving every bond's price equation at once by Newton's method"""
 
-    return price
+    freq = np.atleast_1d(np.asarray(freq, dtype=float))[:, None]
+    y = np.full(len(prices), 0.05)
+    for _ in range(max_iter):
+        discounts = (1 + y[:, None] / freq) ** (-freq * times)
+        error = (cash_flows * discounts).sum(axis=1) - prices
+        slope = -(cash_flows * times * discounts / (1 + y[:, None] / freq)).sum(axis=1) # dP/dy
+        y = y - error / slope
+        if np.all(np.abs(error) < tol * prices):
+            break
+    return y
+
+
+def price_bond_portfolio(curve, bonds):
+
+    """Price a bond inventory off a ZeroCurve: one row per bond with price, yield to maturity, modified duration, convexity and DV01 (for a 1bp fall in yield)"""
+
+    times, cash_flows = cash_flow_matrix(bonds)
+    freq = np.broadcast_to(np.asarray(bonds["freq"], dtype=float), len(times))
+    prices = (cash_flows * curve.discount(times)).sum(axis=1)
+    ytm = bond_yields(prices, times, cash_flows, freq)
+
+    growth = 1 + ytm[:, None] / freq[:, None]
+    pv = cash_flows * growth ** (-freq[:, None] * times) # cash flows discounted at the bond's own yield
+    macaulay = (pv * times).sum(axis=1) / prices
+    modified = macaulay / growth[:, 0]
+    convexity = (pv * times * (times + 1 / freq[:, None])).sum(axis=1) / (prices * growth[:, 0] ** 2)
+
+    return pd.DataFrame({
+        "price":             prices,
+        "ytm":               ytm,
+        "modified_duration": modified,
+        "convexity":         convexity,
+        "dv01":              modified * prices / 10_000,
+    })
+
+
+def key_rate_dv01(curve, jacobian, times, cash_flows):
+
+    """Price change of each instrument (times and cash_flows as returned by cash_flow_matrix) for a 1bp fall in each par yield, through the zero_rate_jacobian"""
+
+    times, cash_flows = np.atleast_2d(times), np.atleast_2d(cash_flows)
+    dprice_drate = -cash_flows * times * curve.discount(times)                    # d price / d zero rate at each payment time
+    weights = curve.rate_weights(times.ravel()).reshape(*times.shape, -1)
+    dprice_dzero = np.einsum("bp,bpk->bk", dprice_drate, weights)
+    return -dprice_dzero @ jacobian / 10_000
 
 
 if __name__ == "__main__":
 
-    maturities, par_yields = fetch_treasury_yields()
-    zero_rates = compute_zero_rates(maturities, par_yields)
-    forward_rates = compute_forward_rates(maturities, zero_rates)
+    maturities, par_yields, zero_rates, forward_rates = load_treasury_curve()
+    _, jacobian = zero_rate_jacobian(maturities, par_yields)
 
-    price = price_bond(maturities, zero_rates, BOND)
+    curve = ZeroCurve(maturities, zero_rates)
+    price = price_bond(curve, BOND)
     print(f"\nBond price ({BOND['maturity']}Y, {BOND['coupon']*100:.2f}% coupon): ${price:.2f}")
+    risk = price_bond_portfolio(curve, BOND).iloc[0]
+    print(f"YTM: {risk['ytm']*100:.3f}% | Modified duration: {risk['modified_duration']:.3f} | Convexity: {risk['convexity']:.2f} | DV01: ${risk['dv01']:.4f}")
+    key_rates = key_rate_dv01(curve, jacobian, *cash_flow_matrix(BOND))[0]
+    print("Key-rate DV01s: " + " | ".join(f"{T:g}Y ${dv01:.4f}" for T, dv01 in zip(maturities, key_rates) if abs(dv01) >= 5e-5))
 
     plot_curves(maturities, par_yields, zero_rates, forward_rates)
 
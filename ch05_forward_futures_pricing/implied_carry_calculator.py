@@ -3,10 +3,13 @@
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from ch04_interest_rates.yield_curve_bootstrap import fetch_treasury_yields, compute_zero_rates
+from ch04_interest_rates.yield_curve_bootstrap import load_treasury_curve, interp_weights, fill_missing_tenors
+from ch01_introduction.portfolio_simulator import PRICE_STORE
+import time
 import yfinance as yf
 from datetime import date
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
@@ -17,23 +20,57 @@ ASSETS = [
     {"name": "EUR/USD",   "type": "currency",     "spot": "EURUSD=X", "futures": ["6EM26.CME", "6EU26.CME", "6EZ26.CME", "6EH27.CME"]},
 ]
 
+# Carry assumptions per asset for the arbitrage scanner, edit them to your own views (annual, continuously compounded):
+# income: dividend yield, convenience yield or foreign rate; storage: storage cost; repo: financing spread over the zero curve
+CARRY_ASSUMPTIONS = {
+    "S&P 500":   {"income": 0.013},
+    "WTI Crude": {"income": 0.0, "storage": 0.02},
+    "EUR/USD":   {"income": 0.02},
+}
+ARBITRAGE_THRESHOLD = 0.005  # Smallest implied vs assumed carry gap reported as an opportunity
+TOP_OPPORTUNITIES = 20  # Largest gaps returned by each scanner update (None returns all of them)
+
+QUOTE_TTL_SECONDS = 60  # Quotes younger than this are served from memory instead of asking Yahoo Finance again
+
 MONTH_CODES = {
     "F": 1, "G": 2, "H": 3, "J": 4, "K": 5,  "M": 6,
     "N": 7, "Q": 8, "U": 9, "V": 10, "X": 11, "Z": 12,
 }
 
 
+_QUOTE_CACHE = {}  # ticker -> (time fetched, latest close)
+
+
+def get_prices(tickers, ttl=QUOTE_TTL_SECONDS):
+    """Returns the latest closing prices of tickers as a float array (NaN where Yahoo Finance has no price), cached for ttl seconds"""
+    now = time.monotonic()
+    stale = [t for t in dict.fromkeys(tickers) if t not in _QUOTE_CACHE or now - _QUOTE_CACHE[t][0] > ttl]
+    if stale:
+        quotes = yf.download(stale, period="5d", group_by="ticker", progress=False)
+        for t in stale:
+            if quotes is not None and t in quotes.columns.get_level_values(0):
+                closes = quotes[t]["Close"].dropna() # Tickers from different exchanges share one date index
+                if not closes.empty:
+                    _QUOTE_CACHE[t] = (now, float(closes.iloc[-1]))
+    return np.array([_QUOTE_CACHE[t][1] if t in _QUOTE_CACHE else np.nan for t in tickers])
+
+
 def get_price(ticker):
     """Returns latest closing price as a float"""
-    return float(yf.Ticker(ticker).history(period="5d")["Close"].iloc[-1])
+    return float(get_prices([ticker])[0])
 
 
-def get_ttm(ticker):
-    """Returns (T, expiry): time to maturity in years and the expiry date"""
+def get_expiry(ticker):
+    """Returns the expiry date parsed from the ticker's month code and year"""
     root = ticker.split(".")[0]
     year = 2000 + int(root[-2:])
     month = MONTH_CODES[root[-3]]
-    expiry = date(year, month, 15)  # 15th of the expiry month as approximation
+    return date(year, month, 15)  # 15th of the expiry month as approximation
+
+
+def get_ttm(ticker):
+    """Returns (T, expiry): time to maturity in years and the expiry date"""
+    expiry = get_expiry(ticker)
     T = (expiry - date.today()).days / 365.25
     return T, expiry
 
@@ -43,8 +80,151 @@ def implied_carry(S, F, r, T):
     return r - (np.log(F / S) / T)
 
 
+def implied_carry_panel(spot, futures, expiries, curve_panel):
+    """Implied carry of every contract on every date, from daily spot and (dates x contracts) futures closes and a ch04 CurvePanel.
+    Returns (T, carry) as (dates x contracts) DataFrames, NaN where a close is missing, the contract has expired or no curve is known yet"""
+
+    dates = futures.index.values.astype("datetime64[D]")
+    T = (np.array(expiries, dtype="datetime64[D]")[None, :] - dates[:, None]).astype(float) / 365.25
+    T[T <= 0] = np.nan
+
+    rows = np.searchsorted(curve_panel.dates, dates, side="right") - 1
+    zero_rates = fill_missing_tenors(curve_panel.maturities, curve_panel.zero_rates[np.maximum(rows, 0)]) # Same rates as np.interp on each date's available tenors
+    zero_rates[rows < 0] = np.nan # No curve known yet on dates before the first one
+    k, w = interp_weights(np.nan_to_num(T), curve_panel.maturities)
+    date_index = np.arange(len(dates))[:, None]
+    r = (1 - w) * zero_rates[date_index, k] + w * zero_rates[date_index, k + 1]
+
+    carry = implied_carry(spot.to_numpy()[:, None], futures.to_numpy(), r, T)
+    return pd.DataFrame(T, index=futures.index, columns=futures.columns), pd.DataFrame(carry, index=futures.index, columns=futures.columns)
+
+
+def carry_history(asset, start_date, end_date, curve_panel):
+    """implied_carry_panel for one entry of ASSETS, on the daily closes of its spot and futures tickers (read through the ch01 price store).
+    Returns None, and the asset is skipped, when its spot has no prices"""
+    tickers = [asset["spot"]] + asset["futures"]
+    bars = PRICE_STORE.get_many(tickers, start_date, end_date)
+    if bars[asset["spot"]].empty:
+        print(f"{asset['name']} skipped: no spot price for {asset['spot']}")
+        return None
+    closes = pd.DataFrame({t: bars[t]["Close"] for t in tickers if not bars[t].empty}).sort_index()
+    closes = closes.dropna(subset=[asset["spot"]])
+    futures = closes.drop(columns=asset["spot"])
+    return implied_carry_panel(closes[asset["spot"]], futures, [get_expiry(t) for t in futures.columns], curve_panel)
+
+
+def save_carry_history(T, carry, path):
+    """Write a carry panel to Parquet in long format (date, contract, T, carry), one row per observed point, float32 values and dictionary-encoded contracts"""
+    table = pd.DataFrame({"T": T.stack(), "carry": carry.stack()}).dropna().astype("float32")
+    table.index.names = ["date", "contract"]
+    table = table.reset_index()
+    table["contract"] = table["contract"].astype("category")
+    table.to_parquet(path, index=False)
+
+
+def load_carry_history(path, contracts=None, start_date=None, end_date=None):
+    """Read back the rows of a saved carry panel, only for the given contracts and [start_date, end_date] if set (the filters are applied while reading)"""
+    filters = []
+    if contracts is not None:
+        filters.append(("contract", "in", list(contracts)))
+    if start_date is not None:
+        filters.append(("date", ">=", pd.Timestamp(start_date)))
+    if end_date is not None:
+        filters.append(("date", "<=", pd.Timestamp(end_date)))
+    return pd.read_parquet(path, filters=filters or None)
+
+
+class CarryScanner:
+    """Cash-and-carry arbitrage scanner over every futures contract in assets, recomputing only the contracts whose inputs changed on each quote update.
+    Futures above the theoretical forward S * exp((r + repo - income + storage) * T) are a cash-and-carry, below it a reverse cash-and-carry"""
+
+    def __init__(self, assets, maturities, zero_rates, assumptions=CARRY_ASSUMPTIONS, threshold=ARBITRAGE_THRESHOLD):
+        self.tickers = [t for asset in assets for t in asset["futures"]]
+        self.asset_names = [asset["name"] for asset in assets for _ in asset["futures"]]
+        self.threshold = threshold
+        n = len(self.tickers)
+        self.S, self.F, self.T, self.r = (np.full(n, np.nan) for _ in range(4))
+        self.implied, self.theoretical = np.full(n, np.nan), np.full(n, np.nan)
+        self.expiries = [get_expiry(t) for t in self.tickers]
+        self._expiry_days = np.array(self.expiries, dtype="datetime64[D]")
+        self._today = None # Day T was last computed for
+        self.income, self.storage, self.repo = np.zeros(n), np.zeros(n), np.zeros(n)
+
+        self._contracts_of = {}    # ticker -> indices of the contracts whose spot or futures price it is
+        for i, asset in enumerate(a for a in assets for _ in a["futures"]):
+            self._contracts_of.setdefault(asset["spot"], []).append(i)
+            self._contracts_of.setdefault(self.tickers[i], []).append(i)
+        self._dirty = np.ones(n, dtype=bool)
+        for name, assumption in assumptions.items():
+            self.set_assumptions(name, **assumption)
+        self.set_curve(maturities, zero_rates)
+
+    def set_curve(self, maturities, zero_rates):
+        """New zero curve: every contract's rate changes"""
+        self.maturities, self.zero_rates = np.asarray(maturities), np.asarray(zero_rates)
+        self._dirty[:] = True
+
+    def set_assumptions(self, asset_name, income=None, storage=None, repo=None):
+        """Change the carry assumptions of one asset (None keeps the current value)"""
+        rows = [i for i, name in enumerate(self.asset_names) if name == asset_name]
+        for values, value in ((self.income, income), (self.storage, storage), (self.repo, repo)):
+            if value is not None:
+                values[rows] = value
+        self._dirty[rows] = True
+
+    def update(self, quotes, top=TOP_OPPORTUNITIES):
+        """Apply {ticker: price} quotes, recompute the contracts they touch and return the top ranked opportunities"""
+        for ticker, price in quotes.items():
+            if np.isnan(price):
+                continue
+            for i in self._contracts_of.get(ticker, ()):
+                prices = self.F if ticker == self.tickers[i] else self.S
+                if prices[i] != price:
+                    prices[i] = price
+                    self._dirty[i] = True
+        self._recompute()
+        return self.opportunities(top)
+
+    def _recompute(self):
+        today = np.datetime64(date.today(), "D")
+        if today != self._today: # Same T as get_ttm, which only moves once a day for every contract
+            self.T = (self._expiry_days - today).astype(float) / 365.25
+            self._today = today
+            self._dirty[:] = True
+        rows = np.flatnonzero(self._dirty)
+        T = np.where(self.T[rows] > 0, self.T[rows], np.nan)  # Expired contracts have no carry
+        r = np.interp(T, self.maturities, self.zero_rates) + self.repo[rows]
+        self.r[rows] = r
+        self.implied[rows] = implied_carry(self.S[rows], self.F[rows], r, T)
+        self.theoretical[rows] = self.S[rows] * np.exp((r - self.income[rows] + self.storage[rows]) * T)
+        self._dirty[rows] = False
+
+    def opportunities(self, top=TOP_OPPORTUNITIES):
+        """The top contracts (all if top is None) whose implied carry differs from the assumed carry (income - storage) by more than the threshold, largest gap first"""
+        gap = self.implied - (self.income - self.storage)
+        rows = np.flatnonzero(np.abs(np.nan_to_num(gap)) > self.threshold)
+        if top is not None and len(rows) > top:
+            rows = rows[np.argpartition(-np.abs(gap[rows]), top - 1)[:top]] # Only the top rows get sorted
+        rows = rows[np.argsort(-np.abs(gap[rows]))]
+        return pd.DataFrame({
+            "asset":       [self.asset_names[i] for i in rows],
+            "ticker":      [self.tickers[i] for i in rows],
+            "expiry":      [self.expiries[i] for i in rows],
+            "S":           self.S[rows],
+            "F":           self.F[rows],
+            "theoretical": self.theoretical[rows],
+            "carry":       self.implied[rows],
+            "gap":         gap[rows],
+            "strategy":    np.where(self.F[rows] > self.theoretical[rows], "cash-and-carry", "reverse cash-and-carry"),
+        })
+
+
 def plot_results(asset_results):
 
+    asset_results = [a for a in asset_results if a["contracts"] and not np.isnan(a["S"])] # Nothing to draw without a spot price and at least one contract
+    if not asset_results:
+        print("No asset to plot.")
+        return
     today = date.today()
     n = len(asset_results)
     fig, axes = plt.subplots(1, n, figsize=(5 * n, 5))
@@ -103,21 +283,36 @@ def plot_results(asset_results):
 
 if __name__ == "__main__":
 
-    maturities, par_yields = fetch_treasury_yields()
-    zero_rates = compute_zero_rates(maturities, par_yields)
+    maturities, _, zero_rates, _ = load_treasury_curve()
+
+    tickers = [t for asset in ASSETS for t in [asset["spot"]] + asset["futures"]]
+    prices = dict(zip(tickers, get_prices(tickers)))  # One batched request for the whole universe
 
     asset_results = []
     for asset in ASSETS:
-        S = get_price(asset["spot"])
+        S = prices[asset["spot"]]
+        if np.isnan(S):
+            print(f"\n{asset['name']} skipped: no spot price for {asset['spot']}")
+            continue
         print(f"\n{asset['name']} (spot = ${S:.4f})")
         contracts = []
         for futures_ticker in asset["futures"]:
-            F = get_price(futures_ticker)
+            F = prices[futures_ticker]
+            if np.isnan(F):
+                print(f"  {futures_ticker} skipped: no price")
+                continue
             T, expiry = get_ttm(futures_ticker)
             r = np.interp(T, maturities, zero_rates)
             carry = implied_carry(S, F, r, T)
             contracts.append({"ticker": futures_ticker, "F": F, "T": T, "expiry": expiry, "r": r, "carry": carry})
             print(f"  {expiry.strftime('%b %Y')} contract: {futures_ticker}  F = ${F:.4f}  T = {T:.2f}Y  r = {100 * r:.2f}%  carry = {100 * carry:.2f}%")
-        asset_results.append({"name": asset["name"], "type": asset["type"], "S": S, "contracts": contracts})
+        if contracts:
+            asset_results.append({"name": asset["name"], "type": asset["type"], "S": S, "contracts": contracts})
+
+    scanner = CarryScanner(ASSETS, maturities, zero_rates)
+    opportunities = scanner.update(prices, top=None)
+    print(f"\nCash-and-carry opportunities (|implied - assumed carry| > {100 * ARBITRAGE_THRESHOLD:.2f}%):")
+    for _, o in opportunities.iterrows():
+        print(f"  {o['ticker']:<10} {o['asset']:<10} F = ${o['F']:.4f}  theoretical = ${o['theoretical']:.4f}  gap = {100 * o['gap']:+.2f}%  {o['strategy']}")
 
     plot_results(asset_results)
\ No newline at end of file
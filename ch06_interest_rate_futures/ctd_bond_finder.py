@@ -2,19 +2,20 @@
 
 import sys
 import os
+import hashlib
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from ch04_interest_rates.yield_curve_bootstrap import fetch_treasury_yields, compute_zero_rates
-from scipy.interpolate import CubicSpline
+from ch04_interest_rates.yield_curve_bootstrap import load_treasury_curve, ZeroCurve
 import numpy as np
+import pandas as pd
 import yfinance as yf
 import matplotlib.pyplot as plt
 from datetime import date, datetime
-from dateutil.relativedelta import relativedelta
 from dataclasses import dataclass
 from openpyxl import load_workbook
 
 
 TCF_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "TCF.xlsx")
+TCF_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".tcf_store") # Parsed spreadsheets, keyed by file hash
 
 # Change these to switch contract
 SECTION_HEADER = "U.S. TREASURY BOND FUTURES CONTRACT"                        # ZB (30-year)
@@ -23,6 +24,7 @@ SECTION_HEADER = "U.S. TREASURY BOND FUTURES CONTRACT"                        #
 DELIVERY_DATE = date(2026, 6, 1)  # first day of delivery month
 FACE = 100  # 100 for pricing convention, the actual face value of all bonds is $100k
 TICKER = "ZBM26.CBT" # Edit the ticker to get the corresponding futures price
+SCENARIO_CHUNK = 100  # Curve scenarios priced per broadcast in ctd_sensitivity
 
 
 def fetch_futures_price(ticker):
@@ -39,127 +41,174 @@ class DeliverableBond:
     delivery_cost: float = None
 
 
-def load_basket(section_header=SECTION_HEADER, delivery_date=DELIVERY_DATE, path=TCF_PATH):
-    """Parse the CME TCF spreadsheet and return the deliverable basket.
+def parse_tcf(path=TCF_PATH):
+    """Parse the CME TCF spreadsheet into one row per (section, delivery_date, bond) with coupon (decimal), maturity, cusip and conversion_factor.
     Download from: https://www.cmegroup.com/trading/interest-rates/treasury-conversion-factors.html"""
 
     wb = load_workbook(path, read_only=True, data_only=True)
-    ws = wb["Conversion Factors"]
-
-    # Locate the contract section header
-    section_row = None
-    for row in ws.iter_rows(min_col=1, max_col=1, values_only=False):
-        cell = row[0]
-        if cell.value and str(cell.value).strip() == section_header:
-            section_row = cell.row
-            break
-    if section_row is None:
-        raise ValueError(f"Could not find '{section_header}' in spreadsheet")
-
-    # Find the delivery month column in the header row
-    header_row = section_row + 5
-    delivery_col = None
-    for cell in ws[header_row]:
-        if isinstance(cell.value, datetime) and cell.value.date() == delivery_date:
-            delivery_col = cell.column
-            break
-    if delivery_col is None:
-        raise ValueError(f"Delivery month {delivery_date} not found in spreadsheet columns")
+    rows = list(wb["Conversion Factors"].iter_rows(values_only=True))
+    wb.close()
 
-    # Read bond data rows to append data for each deliverable bond
-    basket = []
-    for row in ws.iter_rows(min_row=section_row + 6, max_col=delivery_col):
-        coupon_val = row[2].value
-        if coupon_val is None:
-            break
+    records = []
+    for i, row in enumerate(rows):
+        # A section starts with its title in column A, the bond table header (with the delivery months) being 5 rows below
+        if not row[0] or i + 5 >= len(rows) or rows[i + 5][2] != "Coupon":
+            continue
+        section = str(row[0]).strip()
+        delivery_cols = [(col, cell.date()) for col, cell in enumerate(rows[i + 5]) if isinstance(cell, datetime)]
+
+        for bond_row in rows[i + 6:]:
+            coupon_val = bond_row[2] if len(bond_row) > 2 else None
+            if coupon_val is None:
+                break
+            maturity_dt = bond_row[4]
+            maturity = maturity_dt.date() if isinstance(maturity_dt, datetime) else maturity_dt
+            for col, delivery_date in delivery_cols:
+                cf = bond_row[col]
+                if isinstance(cf, (int, float)):  # "-----" means bond is not eligible for this delivery month
+                    records.append((section, delivery_date, coupon_val / 100, maturity, str(bond_row[5]), cf))
+
+    return pd.DataFrame(records, columns=["section", "delivery_date", "coupon", "maturity", "cusip", "conversion_factor"])
+
+
+_TCF_TABLES = {}  # file hash -> parsed table, for repeated loads in one process
+
+
+def tcf_table(path=TCF_PATH, store_dir=TCF_STORE_DIR):
+    """parse_tcf, cached as Parquet under the SHA-256 of the spreadsheet: a new download of the file is parsed again, an unchanged one never is"""
+
+    with open(path, "rb") as f:
+        file_hash = hashlib.sha256(f.read()).hexdigest()
+    if file_hash in _TCF_TABLES:
+        return _TCF_TABLES[file_hash]
+
+    cache_path = os.path.join(store_dir, f"{file_hash}.parquet")
+    if os.path.exists(cache_path):
+        table = pd.read_parquet(cache_path)
+        table["delivery_date"] = table["delivery_date"].dt.date
+        table["maturity"] = table["maturity"].dt.date
+    else:
+        table = parse_tcf(path)
+        os.makedirs(store_dir, exist_ok=True)
+        stored = table.astype({"section": "category", "delivery_date": "datetime64[s]", "maturity": "datetime64[s]"})
+        stored.to_parquet(cache_path, index=False)
+    _TCF_TABLES[file_hash] = table
+    return table
 
-        cf = row[delivery_col - 1].value  # need to substract one because delivery_col comes from cell.column, which is Excel-native and not 0-indexed
-        if not isinstance(cf, (int, float)):
-            continue  # "-----" means bond is not eligible for this delivery month
 
-        maturity_dt = row[4].value
-        cusip = row[5].value
+def load_basket(section_header=SECTION_HEADER, delivery_date=DELIVERY_DATE, path=TCF_PATH):
+    """Return the deliverable basket of one contract section and delivery month of the CME TCF spreadsheet, read from the parsed table of tcf_table.
+    Download from: https://www.cmegroup.com/trading/interest-rates/treasury-conversion-factors.html"""
 
-        basket.append(DeliverableBond(
-            coupon=coupon_val / 100,
-            maturity=maturity_dt.date() if isinstance(maturity_dt, datetime) else maturity_dt,
-            conversion_factor=cf,
-            cusip=str(cusip),
-        ))
+    table = tcf_table(path)
+    section = table[table["section"] == section_header]
+    if section.empty:
+        raise ValueError(f"Could not find '{section_header}' in spreadsheet")
+    rows = section[section["delivery_date"] == delivery_date]
+    if rows.empty:
+        raise ValueError(f"Delivery month {delivery_date} not found in spreadsheet columns")
 
-    wb.close()
-    return basket
+    return [DeliverableBond(coupon=row.coupon, maturity=row.maturity, conversion_factor=row.conversion_factor, cusip=row.cusip)
+            for row in rows.itertuples(index=False)]
 
 
 def accrued_interest(coupon, last_coupon_date, settlement_date, next_coupon_date):
-    """Accrued interest (actual/actual day count convention for Treasuries)"""
+    """Accrued interest (actual/actual day count convention for Treasuries). Works on dates or on datetime64 arrays"""
 
-    days_accrued = (settlement_date - last_coupon_date).days
-    days_in_period = (next_coupon_date - last_coupon_date).days
-    accrued = (coupon / 2) * (days_accrued / days_in_period)
+    accrued = (coupon / 2) * ((settlement_date - last_coupon_date) / (next_coupon_date - last_coupon_date)) # days accrued / days in period
     return accrued
 
 
-def price_bond(coupon, maturity_date, face, forward_curve_fn, settlement_date):
-    """Price bond from settlement date, using a forward zero curve"""
+def basket_schedule(basket, settlement_date, face=FACE):
+    """Cash flows of every bond in the basket from settlement_date: padded (bonds x payments) matrices of payment times (years) and amounts,
+    latest payment first, plus each bond's accrued interest"""
 
-    coupon_dates = []
-    cf_date = maturity_date
-    while cf_date > settlement_date:
-        coupon_dates.append(cf_date)
-        cf_date -= relativedelta(months=6)
-    coupon_dates.reverse()                  # Since we worked backwards from maturity
+    maturities = np.array([bond.maturity for bond in basket], dtype="datetime64[D]")
+    coupons = np.array([bond.coupon for bond in basket], dtype=float)
+    settlement = np.datetime64(settlement_date, "D")
 
-    next_coupon_date = coupon_dates[0]
-    last_coupon_date = next_coupon_date - relativedelta(months=6)
-    accrued = accrued_interest(coupon, last_coupon_date, settlement_date, next_coupon_date)
+    maturity_months = maturities.astype("datetime64[M]")
+    maturity_days = (maturities - maturity_months.astype("datetime64[D]")).astype(int) + 1
+    n_steps = (maturity_months - settlement.astype("datetime64[M]")).astype(int).max() // 6 + 2 # Enough to reach the last coupon date before settlement
+    months = maturity_months[:, None] - 6 * np.arange(n_steps + 1)
+    month_lengths = ((months + 1).astype("datetime64[D]") - months.astype("datetime64[D]")).astype(int)
+    days = np.minimum(maturity_days[:, None], np.minimum.accumulate(month_lengths, axis=1)) # Clipped day carried back, as repeated relativedelta(months=6) steps do
+    dates = months.astype("datetime64[D]") + (days - 1)
 
-    cash_flows = [coupon / 2 * face] * len(coupon_dates)
-    cash_flows[-1] += face
+    paid = dates > settlement
+    n_coupons = paid.sum(axis=1)
+    rows = np.arange(len(basket))
+    accrued = accrued_interest(coupons, dates[rows, n_coupons], settlement, dates[rows, n_coupons - 1])
 
-    dirty_price = 0
-    for cash_flow, coupon_date in zip(cash_flows, coupon_dates):
-        t = (coupon_date - settlement_date).days / 365.25
-        dirty_price += cash_flow * np.exp(-forward_curve_fn(t) * t)
+    width = n_coupons.max()
+    times = np.where(paid, (dates - settlement).astype(float) / 365.25, 0.0)[:, :width]
+    cash_flows = np.where(paid, (coupons / 2 * face)[:, None], 0.0)[:, :width]
+    cash_flows[:, 0] += face  # Face value paid at maturity
+    return times, cash_flows, accrued
 
-    clean_price = dirty_price - accrued
+
+def basket_forward_rates(forward_curve_fn, times):
+    """forward_curve_fn evaluated on every payment time of a schedule in one call (0 on the padding)"""
+
+    paid = times > 0
+    rates = np.zeros_like(times)
+    rates[paid] = forward_curve_fn(times[paid])
+    return rates
+
+
+def price_basket(times, cash_flows, accrued, forward_rates):
+    """Clean prices of every bond of a schedule, or (scenarios x bonds) prices for (scenarios x bonds x payments) forward_rates"""
+
+    dirty_prices = (cash_flows * np.exp(-forward_rates * times)).sum(axis=-1)
+    return dirty_prices - accrued
+
+
+def price_bond(coupon, maturity_date, face, forward_curve_fn, settlement_date):
+    """Price bond from settlement date, using a forward zero curve"""
+
+    times, cash_flows, accrued = basket_schedule([DeliverableBond(coupon, maturity_date, 1.0)], settlement_date, face)
+    clean_price = price_basket(times, cash_flows, accrued, basket_forward_rates(forward_curve_fn, times))[0]
 
     return clean_price
 
 
 def make_forward_curve(spot_fn, t0):
     """Derive forward zero rates starting at t0 from today's spot zero curve.
-    Returns a function: t (years from t0) -> continuously compounded forward zero rate."""
+    Returns a function: t (years from t0, scalar or array) -> continuously compounded forward zero rate."""
 
-    r_t0 = float(spot_fn(t0))
+    r_t0 = spot_fn(t0)
     def forward_fn(t):
         T = t0 + t
-        return (float(spot_fn(T)) * T - r_t0 * t0) / t
+        return (spot_fn(T) * T - r_t0 * t0) / t
     return forward_fn
 
 
 def sort_bonds(basket, futures_price, forward_curve_fn):
 
-    for bond in basket:
-        bond.price = price_bond(bond.coupon, bond.maturity, FACE, forward_curve_fn, DELIVERY_DATE)
+    times, cash_flows, accrued = basket_schedule(basket, DELIVERY_DATE)
+    prices = price_basket(times, cash_flows, accrued, basket_forward_rates(forward_curve_fn, times))
+    for bond, price in zip(basket, prices):
+        bond.price = float(price)
         bond.delivery_cost = bond.price - futures_price * bond.conversion_factor
 
     return sorted(basket, key=lambda b: b.delivery_cost)
 
 
-def ctd_sensitivity(basket, spot_zero_curve_fn, t0):
-    """Price all bonds across a range of parallel yield curve shifts. Returns shifts array
+def ctd_sensitivity(basket, spot_zero_curve_fn, t0, shifts=None):
+    """Price all bonds across a range of parallel yield curve shifts (decimal, -200bp to +200bp in 25bp steps by default). Returns shifts array
     and a (n_bonds x n_shifts) matrix of (price / CF) values."""
 
-    shifts = np.arange(-0.02, 0.0225, 0.0025)
-    price_cf = np.zeros((len(basket), len(shifts)))
+    if shifts is None:
+        shifts = np.arange(-0.02, 0.0225, 0.0025)
+    times, cash_flows, accrued = basket_schedule(basket, DELIVERY_DATE)
+    forward_rates = basket_forward_rates(make_forward_curve(spot_zero_curve_fn, t0), times)
 
-    for j, shift in enumerate(shifts):
-        shifted_spot = lambda t, s=shift: spot_zero_curve_fn(t) + s
-        shifted_forward = make_forward_curve(shifted_spot, t0)
-        for i, bond in enumerate(basket):
-            p = price_bond(bond.coupon, bond.maturity, FACE, shifted_forward, DELIVERY_DATE)
-            price_cf[i, j] = p / bond.conversion_factor
+    # Shifting the spot curve by s shifts every forward zero rate by s too: ((r(t0+t) + s)(t0+t) - (r(t0) + s) t0) / t = r_fwd(t) + s
+    # Every shift of a chunk is priced in one broadcast, chunks bound the (shifts x bonds x payments) temporaries on large grids
+    prices = np.concatenate([price_basket(times, cash_flows, accrued, forward_rates + chunk[:, None, None])
+                             for chunk in np.array_split(shifts, max(1, len(shifts) // SCENARIO_CHUNK))]) # (shifts x bonds)
+    conversion_factors = np.array([bond.conversion_factor for bond in basket])
+    price_cf = (prices / conversion_factors).T
 
     return shifts, price_cf
 
@@ -203,9 +252,8 @@ def plot_ctd_sensitivity(basket, shifts, price_cf):
 if __name__ == "__main__":
 
     basket = load_basket()
-    maturities, par_yields = fetch_treasury_yields()
-    zero_rates = compute_zero_rates(maturities, par_yields)
-    spot_zero_curve_fn = CubicSpline(maturities, zero_rates)
+    maturities, _, zero_rates, _ = load_treasury_curve()
+    spot_zero_curve_fn = ZeroCurve(maturities, zero_rates, interpolation="cubic")
     futures_price = fetch_futures_price(TICKER)
 
     t0 = (DELIVERY_DATE - date.today()).days / 365.25
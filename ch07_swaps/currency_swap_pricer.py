@@ -3,9 +3,8 @@
 import os
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from ch04_interest_rates.yield_curve_bootstrap import fetch_treasury_yields, compute_zero_rates
-from ch05_forward_futures_pricing.implied_carry_calculator import get_price, get_ttm
-from scipy.interpolate import CubicSpline
+from ch04_interest_rates.yield_curve_bootstrap import load_treasury_curve, ZeroCurve
+from ch05_forward_futures_pricing.implied_carry_calculator import get_prices, get_ttm
 from scipy.optimize import brentq
 import numpy as np
 import matplotlib.pyplot as plt
@@ -36,24 +35,6 @@ FOREIGN_LEG_TYPE = "fixed"
 SOLVE_FOR = "foreign"
 
 
-class ZeroCurve:
-    def __init__(self, maturities, zero_rates):
-        self.maturities = maturities
-        self.zero_rates = zero_rates
-        self._spline = CubicSpline(maturities, zero_rates)
-
-    def discount(self, T):
-        return np.exp(-self._spline(T) * T)
-
-    def forward_rate(self, t1, t2):
-        r1 = self._spline(t1)
-        r2 = self._spline(t2)
-        return (r2 * t2 - r1 * t1) / (t2 - t1)
-
-    def shift(self, bps):
-        return ZeroCurve(self.maturities, self.zero_rates + bps / 10_000)
-
-
 class SwapLeg:
     def __init__(self, notional, leg_type, frequency, maturity, curve, rate=None):
         self.notional = notional
@@ -66,47 +47,27 @@ class SwapLeg:
     def payment_dates(self):
         return np.arange(1, self.maturity * self.frequency + 1) / self.frequency
     
-    def pv(self):
-        payment_dates = self.payment_dates() 
-        pv = 0
-
+    def coupon_rates(self, payment_dates):
+        """Rate paid over each accrual period: the fixed rate, or the curve's forward rate for a floating leg"""
         if self.leg_type == "fixed":
-            for cf_date in payment_dates:
-                cf = self.notional * self.rate / self.frequency
-                pv += cf * self.curve.discount(cf_date)
-            pv += self.notional * self.curve.discount(payment_dates[-1])
-            return pv
-        
+            return np.full(len(payment_dates), self.rate)
         elif self.leg_type == "floating":
-            t_prev = 0
-            for t_curr in payment_dates:
-                rate = self.curve.forward_rate(t_prev, t_curr)
-                cf = self.notional * rate * (t_curr - t_prev)
-                pv += cf * self.curve.discount(t_curr)
-                t_prev = t_curr
-            pv += self.notional * self.curve.discount(payment_dates[-1])
-            return pv
+            return self.curve.forward(np.concatenate([[0], payment_dates[:-1]]), payment_dates)
         else:
             raise ValueError(f"Unknown leg type: {self.leg_type}")
 
+    def pv(self):
+        _, coupon_pvs, principal_pv = self.cashflow_pvs()
+        return coupon_pvs.sum() + principal_pv
 
     def cashflow_pvs(self):
         """Returns (payment_dates, coupon_pvs, principal_pv) for plotting."""
         dates = self.payment_dates()
-        coupon_pvs = []
-
-        if self.leg_type == "fixed":
-            for t in dates:
-                coupon_pvs.append(self.notional * self.rate / self.frequency * self.curve.discount(t))
-        elif self.leg_type == "floating":
-            t_prev = 0
-            for t_curr in dates:
-                rate = self.curve.forward_rate(t_prev, t_curr)
-                coupon_pvs.append(self.notional * rate * (t_curr - t_prev) * self.curve.discount(t_curr))
-                t_prev = t_curr
-
-        principal_pv = self.notional * self.curve.discount(dates[-1])
-        return dates, np.array(coupon_pvs), principal_pv
+        accruals = np.diff(dates, prepend=0)
+        discounts = self.curve.discount(dates)
+        coupon_pvs = self.notional * self.coupon_rates(dates) * accruals * discounts
+        principal_pv = self.notional * discounts[-1]
+        return dates, coupon_pvs, principal_pv
 
 
 class CurrencySwap:
@@ -135,20 +96,26 @@ class CurrencySwap:
 def fetch_foreign_zero_curve(spot_ticker, futures_tickers, usd_curve):
     """Derive a foreign zero curve from FX futures via covered interest parity.
     Returns (spot_fx, ZeroCurve)."""
-    spot = get_price(spot_ticker)
+    spot, *futures_prices = get_prices([spot_ticker] + futures_tickers) # One batched request for the spot and every contract
+    if np.isnan(spot):
+        raise ValueError(f"No price for {spot_ticker}")
     print(f"\nSpot FX ({spot_ticker}): {spot:.4f}")
 
     maturities, foreign_zero_rates = [], []
-    for ticker in futures_tickers:
-        F = get_price(ticker)
+    for ticker, F in zip(futures_tickers, futures_prices):
+        if np.isnan(F):
+            print(f"  {ticker} skipped: no price")
+            continue
         T, expiry = get_ttm(ticker)
-        r_domestic = float(usd_curve._spline(T))
+        r_domestic = float(usd_curve.rate(T))
         r_foreign = r_domestic - np.log(F / spot) / T
         maturities.append(T)
         foreign_zero_rates.append(r_foreign)
         print(f"  {expiry.strftime('%b %Y')}  T={T:.2f}Y  F={F:.4f}  r_USD={r_domestic*100:.3f}%  r_foreign={r_foreign*100:.3f}%")
 
-    return spot, ZeroCurve(np.array(maturities), np.array(foreign_zero_rates))
+    if len(maturities) < 2:
+        raise ValueError(f"Need at least 2 priced futures to build the foreign curve, got {len(maturities)}")
+    return spot, ZeroCurve(maturities, foreign_zero_rates, interpolation="cubic")
 
 
 def fx_sensitivity(swap, pct_range=0.05, steps=11):
@@ -255,9 +222,8 @@ def plot_sensitivity(swap):
 
 if __name__ == "__main__":
 
-    maturities, par_yields = fetch_treasury_yields()
-    zero_rates = compute_zero_rates(maturities, par_yields)
-    domestic_zero_curve = ZeroCurve(maturities, zero_rates)
+    maturities, _, zero_rates, _ = load_treasury_curve()
+    domestic_zero_curve = ZeroCurve(maturities, zero_rates, interpolation="cubic")
 
     spot_fx, foreign_zero_curve = fetch_foreign_zero_curve(FOREIGN_SPOT_TICKER, FOREIGN_FUTURES_TICKERS, domestic_zero_curve)
 
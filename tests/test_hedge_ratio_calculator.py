@@ -0,0 +1,74 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ch03_hedging_futures"))
+import numpy as np
+import pandas as pd
+from scipy import stats
+from hedge_ratio_calculator import calculate_hedge_ratio, cross_hedge_matrix, minimum_variance_hedge, rolling_hedge_ratio, walk_forward_backtest
+
+
+def hedge_pair(n_days=600, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2020-01-01", periods=n_days)
+    futures = pd.Series(100 + np.cumsum(rng.normal(0, 1, n_days)), index=dates)
+    spot = pd.Series(100 + np.cumsum(0.8 * futures.diff().fillna(0) + rng.normal(0, 0.5, n_days)), index=dates)
+    return spot, futures
+
+
+def test_rolling_hedge_ratio_nan_only_affects_its_windows():
+    spot, futures = hedge_pair()
+    spot.iloc[300] = np.nan
+    window = 126
+    h_star, _, _ = rolling_hedge_ratio(spot, futures, window)
+
+    spot_delta, futures_delta = spot.diff().iloc[1:], futures.diff().iloc[1:]
+    expected = []
+    for i in range(window, len(spot)):
+        y, x = spot_delta.iloc[i - window:i], futures_delta.iloc[i - window:i]
+        known = y.notna() & x.notna()
+        expected.append(stats.linregress(x[known], y[known]).slope)
+
+    assert not h_star.isna().any()
+    np.testing.assert_allclose(h_star.to_numpy(), expected, rtol=1e-10)
+
+
+def test_cross_hedge_matrix_nan_only_affects_its_pairs():
+    spot, futures = hedge_pair()
+    other_spot, other_futures = hedge_pair(seed=1)
+    spots = pd.DataFrame({"a": spot, "b": other_spot})
+    futures = pd.DataFrame({"x": futures, "y": other_futures})
+    futures.iloc[100:150, 1] = np.nan
+    h_star, rho, _ = cross_hedge_matrix(spots, futures)
+
+    for s in spots:
+        for f in futures:
+            y, x = spots[s].diff(), futures[f].diff()
+            known = y.notna() & x.notna()
+            fit = stats.linregress(x[known], y[known])
+            assert np.isclose(h_star.loc[s, f], fit.slope, rtol=1e-10)
+            assert np.isclose(rho.loc[s, f], fit.rvalue, rtol=1e-10)
+
+
+def test_minimum_variance_hedge_drops_sparse_futures_not_dates():
+    spot, futures = hedge_pair()
+    _, other_futures = hedge_pair(seed=1)
+    strip = pd.DataFrame({"x": futures, "y": other_futures, "z": futures + other_futures})
+    strip.iloc[:200, 1] = np.nan
+    strip.iloc[100:, 2] = np.nan                     # "z" only overlaps "y" on no date at all
+    h_star, contracts, variance_reduction = minimum_variance_hedge(spot, strip)
+
+    expected, _, expected_reduction = minimum_variance_hedge(spot.iloc[200:], strip[["x", "y"]].iloc[200:])
+    np.testing.assert_allclose(h_star.loc[["x", "y"]].to_numpy(), expected.to_numpy(), rtol=1e-10)
+    assert (h_star.loc["z"] == 0).all() and (contracts.loc["z"] == 0).all()
+    assert np.isclose(variance_reduction.iloc[0], expected_reduction.iloc[0], rtol=1e-10)
+
+
+def test_walk_forward_backtest_nan_and_estimation_window():
+    spot, futures = hedge_pair(1000)
+    spot.iloc[900] = np.nan
+    results = walk_forward_backtest(spot, futures, estimation_windows=(126,), holding_periods=(21,))
+
+    assert not results["h_star"].isna().any()
+    start = spot.index.get_loc(results["start_date"].iloc[0])
+    h_star, _, _ = calculate_hedge_ratio(spot.iloc[start - 127:start], futures.iloc[start - 127:start], plot=False)
+    assert np.isclose(results["h_star"].iloc[0], h_star, rtol=1e-10)
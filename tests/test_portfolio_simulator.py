@@ -0,0 +1,61 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ch01_introduction"))
+import numpy as np
+import pandas as pd
+import portfolio_simulator
+from portfolio_simulator import Asset, Bars, IntradayAsset, Position, Portfolio, PriceStore, StreamingPnL
+
+
+def eur_asset(dates, closes, fx):
+    return Asset("ASML.AS", dates[0], dates[-1], data=pd.DataFrame({"Close": closes}, index=dates), currency="EUR", fx=pd.Series(fx, index=dates))
+
+
+def test_streamed_pnl_matches_batch_for_non_usd_asset():
+    dates = pd.bdate_range("2024-01-01", periods=30)
+    closes = 100 + np.cumsum(np.random.default_rng(0).normal(0, 1, len(dates)))
+    fx = np.linspace(1.05, 1.12, len(dates))
+    history = 20
+
+    stream = StreamingPnL(Portfolio([Position(eur_asset(dates[:history], closes[:history], fx[:history]), 10, "short")]))
+    for i in range(history, len(dates)):
+        stream.update(dates[i], "EURUSD=X", fx[i])
+        total = stream.update(dates[i], "ASML.AS", closes[i])
+
+    batch = Portfolio([Position(eur_asset(dates, closes, fx), 10, "short")])
+    assert np.isclose(total, batch.total_daily_cum_pnl()[-1])
+
+    stream.flush()
+    np.testing.assert_allclose(stream.portfolio.total_daily_cum_pnl(), batch.total_daily_cum_pnl())
+
+
+def test_flushed_bars_keep_the_latest_repeated_bar():
+    dates = pd.bdate_range("2024-01-01", periods=5)
+    daily = Asset("SPY", dates[0], dates[-1], data=pd.DataFrame({"Close": np.arange(5.0)}, index=dates), currency="USD")
+    intraday = IntradayAsset("SPY", Bars(dates.as_unit("ns").asi8, np.arange(5.0)))
+    for asset in (daily, intraday):
+        asset.append_bar(dates[4], 10.0)               # Revised last bar of the history
+        asset.append_bar(dates[4] + pd.Timedelta(days=3), 11.0)
+        asset.append_bar(dates[4] + pd.Timedelta(days=3), 12.0) # Repeated streamed bar
+        asset.flush_bars()
+
+        np.testing.assert_array_equal(asset.timestamps(), np.append(dates.as_unit("ns").asi8, (dates[4] + pd.Timedelta(days=3)).value))
+        np.testing.assert_array_equal(np.ravel(asset.close_prices()), [0, 1, 2, 3, 10, 12])
+
+
+def test_price_store_fills_gaps_on_both_sides(tmp_path, monkeypatch):
+    dates = pd.bdate_range("2024-01-01", "2024-12-31")
+    closes = pd.Series(100 + np.arange(len(dates), dtype=float), index=dates)
+
+    def download(ticker, start, end, **kwargs):
+        window = closes[(closes.index >= start) & (closes.index < end)]
+        return pd.DataFrame({"Close": window, "Adj Close": 0.9 * window})
+
+    monkeypatch.setattr(portfolio_simulator.yf, "download", download)
+    store = PriceStore(str(tmp_path))
+    store.get("AAA", "2024-05-01", "2024-07-01")
+    bars = store.get("AAA", "2024-02-01", "2024-10-01")
+
+    expected = 0.9 * closes[(closes.index >= "2024-02-01") & (closes.index < "2024-10-01")]
+    np.testing.assert_allclose(bars["Close"].to_numpy(), expected.to_numpy())
+    assert bars.index.equals(expected.index)